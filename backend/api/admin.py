@@ -0,0 +1,72 @@
+from django.contrib import admin
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html_join
+
+from .models import RequestProfile
+
+DOWNLOADS = {
+    'pstats': ('application/octet-stream', 'pstats'),
+    'collapsed': ('text/plain; charset=utf-8', 'collapsed.txt'),
+}
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created', 'method', 'path', 'view', 'status',
+                    'duration_ms', 'mode', 'user')
+    list_filter = ('mode', 'view', 'status')
+    search_fields = ('path', 'view')
+    fields = ('created', 'user', 'mode', 'method', 'path', 'view', 'status',
+              'duration_ms', 'downloads', 'summary')
+    readonly_fields = ('downloads',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Скачать')
+    def downloads(self, obj):
+        return format_html_join(
+            ' ', '<a href="{}">{}</a>',
+            (
+                (reverse('admin:api_requestprofile_download',
+                         args=(obj.pk, kind)), kind)
+                for kind in DOWNLOADS if getattr(obj, kind)
+            ),
+        )
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/<str:kind>/',
+                self.admin_site.admin_view(self.download),
+                name='api_requestprofile_download',
+            ),
+        ] + super().get_urls()
+
+    def download(self, request, pk, kind):
+        """Файл профиля: pstats для pstats/snakeviz или свернутые
+        стеки для flamegraph.pl/speedscope.
+        """
+
+        if kind not in DOWNLOADS or not self.has_view_permission(request):
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        content = getattr(profile, kind)
+        if not content:
+            raise Http404
+        content_type, extension = DOWNLOADS[kind]
+        response = HttpResponse(
+            bytes(content) if kind == 'pstats' else content,
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=profile-{pk}.{extension}'
+        )
+        return response
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .instrumentation import instrument_serializers
+        from .v1 import signals  # noqa: F401
+
+        instrument_serializers()
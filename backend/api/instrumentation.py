@@ -0,0 +1,184 @@
+import heapq
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+from .metrics import observe_exception, observe_request
+
+logger = logging.getLogger(__name__)
+
+# Метрики текущего запроса; None вне RequestMetricsMiddleware.
+_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Время и число SQL-запросов, время сериализации и рендеринга
+    одного HTTP-запроса.
+    """
+
+    __slots__ = ('started', 'view', 'queries', 'db_time', 'slowest',
+                 'timings', 'depth')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []
+        self.timings = {}
+        self.depth = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += duration
+            # Хранятся только самые медленные запросы, без параметров.
+            entry = (duration, self.queries, sql)
+            if len(self.slowest) < settings.SLOW_REQUEST_QUERIES:
+                heapq.heappush(self.slowest, entry)
+            elif self.slowest and duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def add_time(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def as_dict(self, request, response):
+        """Запись для журнала медленных запросов."""
+
+        return {
+            'view': self.view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': _ms(time.perf_counter() - self.started),
+            'db_ms': _ms(self.db_time),
+            'queries': self.queries,
+            'serialize_ms': _ms(self.timings.get('serialize', 0.0)),
+            'render_ms': _ms(self.timings.get('render', 0.0)),
+            'bytes': (
+                None if response.streaming else len(response.content)
+            ),
+            'slowest_queries': [
+                {'ms': _ms(duration), 'sql': sql}
+                for duration, _, sql in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def server_timing(self, total):
+        parts = [f'db;dur={_ms(self.db_time)};desc="{self.queries} queries"']
+        for name in ('serialize', 'render'):
+            if name in self.timings:
+                parts.append(f'{name};dur={_ms(self.timings[name])}')
+        if self.view:
+            parts.append(f'total;dur={_ms(total)};desc="{self.view}"')
+        else:
+            parts.append(f'total;dur={_ms(total)}')
+        return ', '.join(parts)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+@contextmanager
+def timer(name):
+    """Добавляет время блока к метрике name текущего запроса.
+
+    Вложенные блоки с тем же именем не учитываются повторно:
+    время вложенного сериализатора уже входит во внешний.
+    """
+
+    metrics = _metrics.get()
+    if metrics is None or metrics.depth.get(name):
+        yield
+        return
+    metrics.depth[name] = 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth[name] = 0
+        metrics.add_time(name, time.perf_counter() - started)
+
+
+def _timed_data(data_property):
+    def data(self):
+        with timer('serialize'):
+            return data_property.fget(self)
+    return property(data)
+
+
+def instrument_serializers():
+    """Учитывает время Serializer.data и ListSerializer.data,
+    через которые сериализуются все ответы API.
+    """
+
+    for serializer_class in (serializers.Serializer,
+                             serializers.ListSerializer):
+        if not getattr(serializer_class, '_instrumented', False):
+            serializer_class.data = _timed_data(serializer_class.data)
+            serializer_class._instrumented = True
+
+
+def get_view_name(view_func, method):
+    """RecipeViewSet.list, UserViewSet.subscriptions и т.п."""
+
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{getattr(view_func, "__name__", "")}'
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class RequestMetricsMiddleware:
+    """Добавляет к ответу заголовок Server-Timing (SQL, сериализация,
+    рендеринг, общее время) и пишет в журнал запросы дольше
+    SLOW_REQUEST_MS с самыми медленными SQL-запросами.
+
+    Те же метрики попадают в гистограммы Prometheus (metrics.py).
+    Для потоковых ответов тело кодируется после возврата из
+    middleware, поэтому его время в метрики не попадает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        total = time.perf_counter() - metrics.started
+        response['Server-Timing'] = metrics.server_timing(total)
+        observe_request(request, response, metrics, total)
+        if total * 1000 >= settings.SLOW_REQUEST_MS:
+            entry = metrics.as_dict(request, response)
+            logger.warning(json.dumps(entry, ensure_ascii=False),
+                           extra={'request_metrics': entry})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _metrics.get()
+        if metrics is not None:
+            metrics.view = get_view_name(view_func, request.method)
+
+    def process_exception(self, request, exception):
+        observe_exception(request)
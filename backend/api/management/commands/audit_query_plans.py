@@ -0,0 +1,191 @@
+import json
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe  # isort:skip
+from users.models import Follow, User  # isort:skip
+
+from .check_query_budget import QUERY_BUDGETS  # isort:skip
+
+# Кеш процесса, очищается перед каждым маршрутом: запросы к БД
+# не скрываются готовыми ответами.
+AUDIT_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'audit-query-plans',
+    }
+}
+
+
+class Command(BaseCommand):
+    """
+    Проверяем планы SQL-запросов эндпоинтов API на текущих данных.
+    Команда выполняет GET-маршруты из QUERY_BUDGETS от имени
+    пользователя с подписками, для каждого запроса получает
+    EXPLAIN (ANALYZE, BUFFERS) и отмечает последовательное чтение
+    и сортировку больших таблиц. Имеет смысл на PostgreSQL с данными
+    реального объема (например, после seed_foodgram):
+    python manage.py audit_query_plans --min-rows 10000
+    """
+    help = 'EXPLAIN ANALYZE the SQL queries of API endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            help='Имя пользователя (по умолчанию - с наибольшим '
+                 'числом подписок).',
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=10000,
+            help='С какого числа строк таблица считается большой.',
+        )
+        parser.add_argument(
+            '--route', action='append', dest='routes',
+            help='Проверить только этот маршрут (можно несколько раз).',
+        )
+        parser.add_argument(
+            '--output', help='Файл для JSON-отчета с планами.',
+        )
+        parser.add_argument(
+            '--no-assert', action='store_true',
+            help='Не завершаться с ошибкой при найденных проблемах.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE поддерживается '
+                               'только для PostgreSQL.')
+        routes = {
+            name: url for name, (method, url, _) in QUERY_BUDGETS.items()
+            if method == 'get'
+            and (not options['routes'] or name in options['routes'])
+        }
+        if not routes:
+            raise CommandError('Нет GET-маршрутов для проверки.')
+
+        with transaction.atomic():
+            context = self.get_context(options['user'])
+            table_rows = self.get_table_rows()
+            report = {}
+            for name, url in routes.items():
+                report[name] = self.audit_route(
+                    url.format(**context), context['user'],
+                    table_rows, options['min_rows'],
+                )
+            transaction.set_rollback(True)
+
+        problems = 0
+        for name, result in report.items():
+            self.stdout.write(
+                f'{name}: {len(result["queries"])} запросов, '
+                f'{result["execution_ms"]} мс'
+            )
+            for query in result['queries']:
+                for flag in query['flags']:
+                    problems += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'  {flag}\n    {query["sql"][:200]}'
+                    ))
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        if problems and not options['no_assert']:
+            raise CommandError(f'Найдено проблем в планах: {problems}')
+
+    def get_context(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'Пользователь {username} не найден.')
+        else:
+            top = Follow.objects.values('user').annotate(
+                follows=Count('id')
+            ).order_by('-follows').first()
+            user = User.objects.filter(
+                pk=top['user'] if top else None
+            ).first() or User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('В БД нет пользователей.')
+        recipe = Recipe.objects.exclude(author=user).only(
+            'pk', 'author_id'
+        ).first()
+        if recipe is None:
+            raise CommandError('В БД нет рецептов других авторов.')
+        author = user.follower.values_list('author_id', flat=True).first()
+        return {
+            'user': user,
+            'recipe': recipe.pk,
+            'author': author or recipe.author_id,
+        }
+
+    def get_table_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class "
+                "WHERE relkind IN ('r', 'm') "
+                "AND relnamespace = 'public'::regnamespace"
+            )
+            return dict(cursor.fetchall())
+
+    def audit_route(self, url, user, table_rows, min_rows):
+        client = APIClient()
+        client.force_authenticate(user)
+        with override_settings(CACHES=AUDIT_CACHES, DATABASE_REPLICAS=[]):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+        queries, execution_ms = [], 0
+        for sql in dict.fromkeys(query['sql'] for query in captured):
+            if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql
+                )
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            execution_ms += plan[0]['Execution Time']
+            queries.append({
+                'sql': sql,
+                'execution_ms': plan[0]['Execution Time'],
+                'flags': list(self.find_problems(
+                    plan[0]['Plan'], table_rows, min_rows
+                )),
+                'plan': plan[0]['Plan'],
+            })
+        return {
+            'url': url,
+            'status': response.status_code,
+            'execution_ms': round(execution_ms, 3),
+            'queries': queries,
+        }
+
+    def find_problems(self, node, table_rows, min_rows):
+        """Последовательное чтение большой таблицы, сортировка
+        большого числа строк и сортировка на диске.
+        """
+
+        node_type = node['Node Type']
+        if node_type == 'Seq Scan':
+            rows = table_rows.get(node['Relation Name'], 0)
+            if rows >= min_rows:
+                yield (f'Seq Scan по {node["Relation Name"]} '
+                       f'(~{int(rows)} строк)')
+        elif node_type in ('Sort', 'Incremental Sort'):
+            child = node['Plans'][0]
+            rows = child['Actual Rows'] * child['Actual Loops']
+            if rows >= min_rows:
+                yield (f'{node_type} {int(rows)} строк '
+                       f'по {", ".join(node["Sort Key"])}')
+            if node.get('Sort Space Type') == 'Disk':
+                yield f'{node_type} на диске ({node["Sort Space Used"]} КБ)'
+        for child in node.get('Plans', ()):
+            yield from self.find_problems(child, table_rows, min_rows)
@@ -0,0 +1,20 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.v1.cache import get_stats  # isort:skip
+
+CACHES = ('recipes', 'recipe-payloads')
+
+
+class Command(BaseCommand):
+    """
+    Выводим число попаданий и промахов кеша ответов API в JSON:
+    python manage.py cache_stats
+    """
+    help = 'Show hit/miss counters of API response caches.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(
+            {name: get_stats(name) for name in CACHES}, indent=2
+        ))
@@ -0,0 +1,347 @@
+import json
+import random
+import statistics
+import sys
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import (FavoritesList, Ingredient, Recipe,  # isort:skip
+                            RecipeIngredient, ShoppingList,
+                            ShoppingListIngredient, Tag)
+from users.models import Follow, User  # isort:skip
+
+# Отдельный кеш процесса, очищается перед каждым замером: потолки
+# относятся к запросу с холодным кешем и не зависят от порядка маршрутов.
+BUDGET_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'check-query-budget',
+    }
+}
+
+# Маршрут: (метод, адрес, потолок запросов). Потолок - число
+# запросов маршрута с холодным кешем плюс запас в один-два запроса.
+# В адресах подставляются {recipe}, {other_recipe}, {own_recipe},
+# {author} и {me}, тело запроса берется из payloads по имени маршрута.
+QUERY_BUDGETS = {
+    'recipes-list': ('get', '/api/recipes/?limit=6', 8),
+    'recipes-list-large': ('get', '/api/recipes/?limit=50', 8),
+    'recipes-list-cursor': (
+        'get', '/api/recipes/?pagination=cursor&limit=50', 7
+    ),
+    'recipes-detail': ('get', '/api/recipes/{recipe}/', 6),
+    'recipes-filter-tags': ('get', '/api/recipes/?tags=tag-0&tags=tag-1', 9),
+    'recipes-filter-tags-unknown': (
+        'get', '/api/recipes/?tags=no-such-tag', 2
+    ),
+    'recipes-filter-author': ('get', '/api/recipes/?author={author}', 9),
+    'recipes-filter-favorited': ('get', '/api/recipes/?is_favorited=1', 8),
+    'recipes-filter-cart': ('get', '/api/recipes/?is_in_shopping_cart=1', 8),
+    'recipes-filter-favorited-anonymous': (
+        'get', '/api/recipes/?is_favorited=1', 2
+    ),
+    'recipes-filter-cart-anonymous': (
+        'get', '/api/recipes/?is_in_shopping_cart=1', 2
+    ),
+    'recipes-filter-empty': (
+        'get', '/api/recipes/?author={me}&is_favorited=1', 3
+    ),
+    'recipes-favorite-add': (
+        'post', '/api/recipes/{other_recipe}/favorite/', 7
+    ),
+    'recipes-favorite-remove': (
+        'delete', '/api/recipes/{other_recipe}/favorite/', 6
+    ),
+    'recipes-shopping-cart-add': (
+        'post', '/api/recipes/{other_recipe}/shopping_cart/', 8
+    ),
+    'recipes-shopping-cart-remove': (
+        'delete', '/api/recipes/{other_recipe}/shopping_cart/', 9
+    ),
+    'recipes-update': ('patch', '/api/recipes/{own_recipe}/', 16),
+    'recipes-download-shopping-cart': (
+        'get', '/api/recipes/download_shopping_cart/', 4
+    ),
+    'users-list': ('get', '/api/users/', 4),
+    'users-me': ('get', '/api/users/me/', 2),
+    'users-subscriptions': (
+        'get', '/api/users/subscriptions/?recipes_limit=3', 5
+    ),
+    'users-subscribe': ('post', '/api/users/{author}/subscribe/', 9),
+    'users-unsubscribe': ('delete', '/api/users/{author}/subscribe/', 6),
+    'ingredients-list': ('get', '/api/ingredients/', 2),
+    'ingredients-search': ('get', '/api/ingredients/?name=ing', 2),
+    'tags-list': ('get', '/api/tags/', 2),
+}
+
+# Поля, которые должен содержать ответ маршрута.
+EXPECTED_FIELDS = {
+    'recipes-filter-empty': {'count': 0, 'results': []},
+    'recipes-filter-tags-unknown': {'count': 0, 'results': []},
+    'recipes-filter-favorited-anonymous': {'count': 0, 'results': []},
+    'recipes-filter-cart-anonymous': {'count': 0, 'results': []},
+}
+
+# Маршруты, которые запрашиваются без аутентификации.
+ANONYMOUS_ROUTES = {
+    'recipes-filter-favorited-anonymous',
+    'recipes-filter-cart-anonymous',
+}
+
+
+class Command(BaseCommand):
+    """
+    Проверяем число SQL-запросов и время ответа эндпоинтов API.
+    Команда наполняет БД тестовыми данными внутри транзакции,
+    выполняет запросы к каждому маршруту из QUERY_BUDGETS,
+    сравнивает число запросов с потолком и откатывает транзакцию.
+    Результат выводится в формате JSON, при превышении потолка
+    команда завершается с ненулевым кодом:
+    python manage.py check_query_budget --output budget.json
+    """
+    help = 'Check SQL query budgets and timings of API endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=30)
+        parser.add_argument('--recipes', type=int, default=120)
+        parser.add_argument('--ingredients', type=int, default=300)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=10)
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Сколько раз выполнять каждый запрос для замера времени.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Файл для JSON-отчета (по умолчанию stdout).',
+        )
+        parser.add_argument(
+            '--baseline', help='JSON-отчет прошлого запуска для сравнения.',
+        )
+        parser.add_argument(
+            '--no-assert', action='store_true',
+            help='Не завершаться с ошибкой при превышении потолка.',
+        )
+
+    def handle(self, *args, **options):
+        # APIClient отправляет Host: testserver.
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=allowed_hosts), \
+                transaction.atomic():
+            context = self.seed(options)
+            report = self.measure(context, options['repeat'])
+            transaction.set_rollback(True)
+
+        if options['baseline']:
+            self.compare(report, options['baseline'])
+        payload = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as output:
+                output.write(payload)
+        else:
+            self.stdout.write(payload)
+
+        failed = [
+            name for name, result in report['routes'].items()
+            if not result['ok']
+        ]
+        if failed and not options['no_assert']:
+            raise CommandError(
+                'Превышен потолок запросов или неверный ответ: '
+                + ', '.join(failed)
+            )
+
+    def seed(self, options):
+        # bulk_create возвращает id не во всех СУБД, поэтому
+        # созданные строки перечитываются по префиксу имени.
+        rnd = random.Random(options['seed'])
+        User.objects.bulk_create(
+            User(
+                username=f'budget-user-{i}',
+                email=f'budget-user-{i}@foodgram.test',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='!',
+            )
+            for i in range(max(options['users'], 3))
+        )
+        users = list(User.objects.filter(
+            username__startswith='budget-user-'
+        ).order_by('id'))
+        Tag.objects.bulk_create(
+            Tag(name=f'budget-tag-{i}', slug=f'tag-{i}',
+                color=f'#00000{i}')
+            for i in range(5)
+        )
+        tags = list(Tag.objects.filter(name__startswith='budget-tag-'))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient-{i}', measurement_unit='г')
+            for i in range(max(options['ingredients'],
+                               options['ingredients_per_recipe']))
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='ingredient-'
+        ))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[i % len(users)],
+                name=f'budget-recipe-{i}',
+                text='Описание',
+                image='recipes/budget.png',
+                cooking_time=rnd.randint(1, 120),
+            )
+            for i in range(max(options['recipes'], 2))
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith='budget-recipe-'
+        ).order_by('id'))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=rnd.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rnd.sample(
+                ingredients, options['ingredients_per_recipe']
+            )
+        )
+        RecipeTag = Recipe.tags.through
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe in recipes
+            for tag in rnd.sample(tags, 2)
+        )
+
+        user, author = users[0], users[1]
+        own = [recipe for recipe in recipes if recipe.author_id != user.id]
+        FavoritesList.objects.bulk_create(
+            FavoritesList(user=user, recipe=recipe) for recipe in own[1::2]
+        )
+        ShoppingList.objects.bulk_create(
+            ShoppingList(user=user, recipe=recipe) for recipe in own[1::3]
+        )
+        ShoppingListIngredient.objects.rebuild([user.id])
+        Follow.objects.bulk_create(
+            Follow(user=user, author=followed) for followed in users[2:]
+        )
+        # Правка своего рецепта: одно количество меняется,
+        # один ингредиент удаляется и один добавляется.
+        own_recipe = next(
+            recipe for recipe in recipes if recipe.author_id == user.id
+        )
+        amounts = dict(RecipeIngredient.objects.filter(
+            recipe=own_recipe
+        ).values_list('ingredient_id', 'amount'))
+        changed, removed = list(amounts)[:2]
+        amounts[changed] += 1
+        del amounts[removed]
+        amounts[next(
+            ingredient.id for ingredient in ingredients
+            if ingredient.id not in amounts and ingredient.id != removed
+        )] = 1
+        return {
+            'user': user,
+            'recipe': own[1].id,
+            'other_recipe': own[0].id,
+            'own_recipe': own_recipe.id,
+            'author': author.id,
+            'me': user.id,
+            'payloads': {
+                'recipes-update': {
+                    'ingredients': [
+                        {'id': ingredient_id, 'amount': amount}
+                        for ingredient_id, amount in amounts.items()
+                    ],
+                    'tags': [tag.id for tag in tags[:2]],
+                    'name': 'budget-recipe-updated',
+                },
+            },
+        }
+
+    @override_settings(CACHES=BUDGET_CACHES)
+    def measure(self, context, repeat):
+        user_client = APIClient()
+        user_client.force_authenticate(context['user'])
+        anonymous_client = APIClient()
+        routes = {}
+        for name, (method, url, budget) in QUERY_BUDGETS.items():
+            client = (
+                anonymous_client if name in ANONYMOUS_ROUTES else user_client
+            )
+            url = url.format(**context)
+            payload = context['payloads'].get(name)
+            queries, timings, status = [], [], None
+            removes = name.endswith('-remove') or name == 'users-unsubscribe'
+            for _ in range(max(repeat, 1)):
+                if removes:
+                    client.post(url)
+                cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    if payload is None:
+                        response = getattr(client, method)(url)
+                    else:
+                        response = getattr(client, method)(
+                            url, payload, format='json'
+                        )
+                    if response.streaming:
+                        content = b''.join(response.streaming_content)
+                    else:
+                        content = response.content
+                    timings.append(time.perf_counter() - started)
+                queries.append(len(captured))
+                status = response.status_code
+                unexpected = self.check_fields(name, status, content)
+                if method == 'post':
+                    client.delete(url)
+            routes[name] = {
+                'method': method.upper(),
+                'url': url,
+                'status': status,
+                'queries': max(queries),
+                'budget': budget,
+                'unexpected': unexpected,
+                'ok': max(queries) <= budget and status < 400
+                and not unexpected,
+                'time_ms': {
+                    'min': round(min(timings) * 1000, 3),
+                    'median': round(statistics.median(timings) * 1000, 3),
+                    'max': round(max(timings) * 1000, 3),
+                },
+            }
+        return {
+            'vendor': connection.vendor,
+            'python': sys.version.split()[0],
+            'repeat': repeat,
+            'routes': routes,
+        }
+
+    def check_fields(self, name, status, content):
+        """Поля ответа, не совпавшие с EXPECTED_FIELDS."""
+
+        expected = EXPECTED_FIELDS.get(name)
+        if not expected or status >= 400:
+            return {}
+        data = json.loads(content)
+        return {
+            field: data.get(field) for field, value in expected.items()
+            if data.get(field) != value
+        }
+
+    def compare(self, report, baseline_path):
+        with open(baseline_path, encoding='UTF-8') as baseline_file:
+            baseline = json.load(baseline_file)['routes']
+        for name, result in report['routes'].items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            result['delta'] = {
+                'queries': result['queries'] - previous['queries'],
+                'median_ms': round(
+                    result['time_ms']['median']
+                    - previous['time_ms']['median'], 3
+                ),
+            }
@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import RequestProfile  # isort:skip
+from api.profiling import make_token  # isort:skip
+
+
+class Command(BaseCommand):
+    """
+    Выдаем токен для профилирования запросов API.
+    Токен передается в заголовке X-Profile (или параметре _profile),
+    профиль сохраняется и скачивается в админке (Профили запросов):
+    python manage.py profile_token admin --mode sample
+    """
+    help = 'Issue a signed token that enables request profiling.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Сотрудник (is_staff).')
+        parser.add_argument(
+            '--mode', choices=dict(RequestProfile.MODES),
+            default=RequestProfile.CPROFILE,
+            help='cprofile - pstats, sample - выборка стеков.',
+        )
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(
+            username=options['username'], is_staff=True, is_active=True
+        ).first()
+        if user is None:
+            raise CommandError(
+                f'Активный сотрудник {options["username"]} не найден.'
+            )
+        token = make_token(user, options['mode'])
+        self.stdout.write(token)
+        self.stderr.write(
+            f'curl -H "X-Profile: {token}" http://localhost:8000/api/...'
+        )
@@ -0,0 +1,128 @@
+import os
+
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .v1.cache import get_stats
+
+# Кеши со статистикой попаданий (count_lookup).
+STAT_CACHES = ('recipes', 'recipe-payloads')
+
+LABELS = ('view', 'method')
+
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'HTTP requests by view, method and status class.',
+    LABELS + ('status',),
+)
+EXCEPTIONS = Counter(
+    'foodgram_http_exceptions_total',
+    'Unhandled exceptions by view and method.',
+    LABELS,
+)
+LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Request latency by view and method.',
+    LABELS,
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+QUERIES = Histogram(
+    'foodgram_http_request_queries',
+    'SQL queries per request by view and method.',
+    LABELS,
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+DB_TIME = Histogram(
+    'foodgram_http_request_db_seconds',
+    'SQL time per request by view and method.',
+    LABELS,
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+
+
+def get_view_label(request):
+    """Имя маршрута API (recipes-list, recipes-favorite,
+    ingredients-list); остальные адреса объединяются, чтобы
+    не раздувать число рядов.
+    """
+
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    if match.app_name == 'api_v1' and match.url_name:
+        return match.url_name
+    return 'other'
+
+
+def observe_request(request, response, metrics, duration):
+    labels = (get_view_label(request), request.method)
+    REQUESTS.labels(*labels, f'{response.status_code // 100}xx').inc()
+    LATENCY.labels(*labels).observe(duration)
+    QUERIES.labels(*labels).observe(metrics.queries)
+    DB_TIME.labels(*labels).observe(metrics.db_time)
+
+
+def observe_exception(request):
+    EXCEPTIONS.labels(get_view_label(request), request.method).inc()
+
+
+class CacheStatsCollector:
+    """Попадания и промахи кешей ответов. Счетчики хранятся
+    в кеше Django и суммированы по процессам, если его бэкенд
+    общий (CACHE_BACKEND, например Redis или Memcached).
+    """
+
+    def collect(self):
+        hits = CounterMetricFamily(
+            'foodgram_cache_hits', 'Response cache hits.', labels=['cache']
+        )
+        misses = CounterMetricFamily(
+            'foodgram_cache_misses', 'Response cache misses.',
+            labels=['cache'],
+        )
+        ratio = GaugeMetricFamily(
+            'foodgram_cache_hit_ratio', 'Response cache hit ratio.',
+            labels=['cache'],
+        )
+        for name in STAT_CACHES:
+            stats = get_stats(name)
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            if stats['hit_ratio'] is not None:
+                ratio.add_metric([name], stats['hit_ratio'])
+        yield hits
+        yield misses
+        yield ratio
+
+
+def get_registry():
+    """Реестр для выгрузки: с PROMETHEUS_MULTIPROC_DIR метрики
+    собираются из файлов всех процессов gunicorn.
+    """
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = CollectorRegistry()
+        registry.register(_ProcessCollector())
+    registry.register(CacheStatsCollector())
+    return registry
+
+
+class _ProcessCollector:
+    """Метрики процесса из глобального реестра (однопроцессный режим)."""
+
+    def collect(self):
+        return REGISTRY.collect()
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus."""
+
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.19 on 2026-10-18 04:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('mode', models.CharField(choices=[('cprofile', 'cProfile (pstats)'), ('sample', 'Выборка стеков (collapsed)')], max_length=16, verbose_name='Профилировщик')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.CharField(max_length=2000, verbose_name='Адрес')),
+                ('view', models.CharField(blank=True, max_length=200, verbose_name='Представление')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='Код ответа')),
+                ('duration_ms', models.FloatField(verbose_name='Длительность, мс')),
+                ('summary', models.TextField(blank=True, verbose_name='Сводка')),
+                ('pstats', models.BinaryField(null=True, verbose_name='pstats')),
+                ('collapsed', models.TextField(blank=True, verbose_name='Свернутые стеки')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL, verbose_name='Кто запросил')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ('-created',),
+            },
+        ),
+    ]
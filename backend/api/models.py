@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    """Результат профилирования одного запроса (см. profiling.py)."""
+
+    CPROFILE = 'cprofile'
+    SAMPLE = 'sample'
+    MODES = (
+        (CPROFILE, 'cProfile (pstats)'),
+        (SAMPLE, 'Выборка стеков (collapsed)'),
+    )
+
+    created = models.DateTimeField('Дата', auto_now_add=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='request_profiles',
+        verbose_name='Кто запросил',
+    )
+    mode = models.CharField('Профилировщик', max_length=16, choices=MODES)
+    method = models.CharField('Метод', max_length=10)
+    path = models.CharField('Адрес', max_length=2000)
+    view = models.CharField('Представление', max_length=200, blank=True)
+    status = models.PositiveSmallIntegerField('Код ответа')
+    duration_ms = models.FloatField('Длительность, мс')
+    summary = models.TextField('Сводка', blank=True)
+    pstats = models.BinaryField('pstats', null=True, editable=False)
+    collapsed = models.TextField('Свернутые стеки', blank=True)
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} мс)'
@@ -0,0 +1,209 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+
+from .instrumentation import get_view_name
+from .models import RequestProfile
+
+SALT = 'foodgram.request-profile'
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = '_profile'
+
+
+def make_token(user, mode=RequestProfile.CPROFILE):
+    """Подписанный токен для профилирования запросов от имени
+    сотрудника user, действует PROFILE_TOKEN_MAX_AGE секунд.
+    """
+
+    return signing.dumps({'user': user.pk, 'mode': mode}, salt=SALT)
+
+
+def read_token(token):
+    """(пользователь, режим) для действующего токена, иначе None."""
+
+    try:
+        data = signing.loads(
+            token, salt=SALT, max_age=settings.PROFILE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    if data.get('mode') not in dict(RequestProfile.MODES):
+        return None
+    user = get_user_model().objects.filter(
+        pk=data.get('user'), is_staff=True, is_active=True
+    ).first()
+    return None if user is None else (user, data['mode'])
+
+
+def _short_path(filename):
+    for prefix in sorted(filter(None, sys.path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+class DeterministicProfiler:
+    """cProfile: все вызовы потока запроса, результат в pstats."""
+
+    mode = RequestProfile.CPROFILE
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.profile.create_stats()
+
+    def result(self):
+        summary = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=summary)
+        stats.sort_stats('cumulative').print_stats(40)
+        return {
+            'summary': summary.getvalue(),
+            # Формат файла Stats.dump_stats.
+            'pstats': marshal.dumps(stats.stats),
+        }
+
+
+class SamplingProfiler:
+    """Выборка стеков потока запроса раз в PROFILE_SAMPLE_INTERVAL
+    секунд из отдельного потока. Почти не замедляет запрос,
+    результат - свернутые стеки для flamegraph.
+    """
+
+    mode = RequestProfile.SAMPLE
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.labels = {}
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.run, daemon=True)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.sampler.join()
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = (
+                f'{code.co_name} '
+                f'({_short_path(code.co_filename)}:{code.co_firstlineno})'
+            )
+        return label
+
+    def run(self):
+        while not self.stopped.wait(settings.PROFILE_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self.label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def result(self):
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        summary = [f'Выборок: {sum(leaves.values())}', '']
+        summary += [
+            f'{count * 100 / total:6.1f}%  {leaf}'
+            for leaf, count in leaves.most_common(40)
+        ]
+        return {
+            'summary': '\n'.join(summary),
+            'collapsed': '\n'.join(
+                f'{stack} {count}' for stack, count in self.stacks.items()
+            ),
+        }
+
+
+PROFILERS = {
+    RequestProfile.CPROFILE: DeterministicProfiler,
+    RequestProfile.SAMPLE: SamplingProfiler,
+}
+
+
+class RequestProfilingMiddleware:
+    """Профилирует запрос с токеном сотрудника (make_token)
+    в заголовке X-Profile или параметре _profile.
+
+    Профиль сохраняется в RequestProfile и скачивается в админке,
+    его номер возвращается в заголовке X-Profile-Id. Потоковый
+    ответ формируется целиком под профилировщиком. Запросы без
+    токена проходят без дополнительной работы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get(HEADER)
+        if token is None:
+            if QUERY_PARAM not in request.META.get('QUERY_STRING', ''):
+                return self.get_response(request)
+            token = request.GET.get(QUERY_PARAM)
+            if not token:
+                return self.get_response(request)
+        found = read_token(token)
+        if found is None:
+            response = self.get_response(request)
+            response['X-Profile-Error'] = 'invalid or expired token'
+            return response
+        return self.profile(request, *found)
+
+    def get_path(self, request):
+        """Адрес запроса без токена."""
+
+        query = request.GET.copy()
+        query.pop(QUERY_PARAM, None)
+        if not query:
+            return request.path
+        return f'{request.path}?{query.urlencode()}'
+
+    def profile(self, request, user, mode):
+        started = time.perf_counter()
+        with PROFILERS[mode]() as profiler:
+            response = self.get_response(request)
+            if response.streaming:
+                response.streaming_content = [
+                    b''.join(response.streaming_content)
+                ]
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        profile = RequestProfile.objects.create(
+            user=user,
+            mode=mode,
+            method=request.method,
+            path=self.get_path(request)[:2000],
+            view=(
+                get_view_name(match.func, request.method) if match else ''
+            ),
+            status=response.status_code,
+            duration_ms=round(duration * 1000, 3),
+            **profiler.result(),
+        )
+        stale = list(RequestProfile.objects.values_list(
+            'pk', flat=True
+        )[settings.PROFILE_KEEP:])
+        if stale:
+            RequestProfile.objects.filter(pk__in=stale).delete()
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
@@ -0,0 +1,62 @@
+import heapq
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+from foodgram.routers import primary
+from recipes.models import Ingredient
+
+from .cache import get_version
+
+
+class IngredientPrefixIndex:
+    """Индекс ингредиентов в памяти процесса для поиска по началу
+    названия без обращения к БД.
+
+    Названия хранятся в casefold в отсортированном списке, поиск
+    префикса - два bisect. Результаты возвращаются в порядке
+    Ingredient.Meta.ordering. Индекс перестраивается при смене
+    версии 'ingredients' (см. signals.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (версия, строки, ключи, позиции) заменяются одним
+        # присваиванием, поиск без блокировки видит целый снимок.
+        self._snapshot = (None, [], [], [])
+
+    def _build(self, version):
+        with primary():
+            rows = list(Ingredient.objects.values(
+                'id', 'name', 'measurement_unit'
+            ))
+        entries = sorted(
+            (row['name'].casefold(), position)
+            for position, row in enumerate(rows)
+        )
+        keys = [key for key, _ in entries]
+        positions = [position for _, position in entries]
+        self._snapshot = (version, rows, keys, positions)
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix
+        (не больше limit), и общее число совпадений.
+        """
+
+        version = get_version('ingredients')
+        if version != self._snapshot[0]:
+            with self._lock:
+                if version != self._snapshot[0]:
+                    self._build(version)
+        _, rows, keys, positions = self._snapshot
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        key = prefix.casefold()
+        start = bisect_left(keys, key)
+        end = bisect_left(keys, key + '\U0010ffff', start)
+        found = heapq.nsmallest(limit, positions[start:end])
+        return [rows[position] for position in found], end - start
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,89 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+def get_version(name):
+    """Текущая версия набора данных (например, 'ingredients').
+
+    Версия - время последнего изменения в наносекундах, поэтому
+    ее можно отдавать как Last-Modified, а после вытеснения ключа
+    из кеша она не совпадет с уже выданной.
+    """
+
+    return cache.get_or_set(f'version:{name}', time.time_ns, timeout=None)
+
+
+def get_versions(*names):
+    """Версии нескольких наборов данных за одно обращение к кешу."""
+
+    keys = [f'version:{name}' for name in names]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        found.update(cache.get_many(missing))
+    return [found[key] for key in keys]
+
+
+def bump_version(name):
+    """Помечает закешированные данные набора устаревшими."""
+
+    version = time.time_ns()
+    cache.set(f'version:{name}', version, timeout=None)
+    return version
+
+
+def bump_versions(*names):
+    """bump_version для нескольких наборов одним обращением."""
+
+    version = time.time_ns()
+    cache.set_many(
+        {f'version:{name}': version for name in names}, timeout=None
+    )
+    return version
+
+
+def make_key(prefix, request, *versions):
+    """Ключ ответа: адрес и параметры запроса без учета их порядка
+    и версии данных, из которых он собран.
+    """
+
+    params = sorted(
+        (name, sorted(values))
+        for name, values in request.query_params.lists()
+        if any(values)
+    )
+    digest = hashlib.sha256(repr((
+        request.scheme, request.get_host(), request.path, params
+    )).encode()).hexdigest()
+    return ':'.join([prefix, digest, *map(str, versions)])
+
+
+def count_lookup(name, hit, delta=1):
+    """Увеличивает счетчик попаданий или промахов кеша name."""
+
+    if not delta:
+        return
+    key = f'stats:{name}:{"hits" if hit else "misses"}'
+    if not cache.add(key, delta, timeout=None):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, timeout=None)
+
+
+def get_stats(name):
+    """Число попаданий и промахов кеша name."""
+
+    found = cache.get_many([f'stats:{name}:hits', f'stats:{name}:misses'])
+    hits = found.get(f'stats:{name}:hits', 0)
+    misses = found.get(f'stats:{name}:misses', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
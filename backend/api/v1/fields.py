@@ -0,0 +1,127 @@
+import binascii
+from base64 import b64decode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+IMAGE_FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'WEBP': 'webp',
+    'GIF': 'gif',
+}
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Временный файл с декодированным изображением.
+
+    Хранилище перемещает такой файл вместо копирования, поэтому
+    при удалении объекта файл закрывается без ошибки об отсутствии.
+    """
+
+    def __del__(self):
+        self.close()
+
+
+class RecipeImageField(serializers.ImageField):
+    """Изображение рецепта строкой base64 (data:image/...;base64,...)
+    или файлом в multipart/form-data.
+
+    Base64 декодируется частями во временный файл, размер
+    проверяется до декодирования, а число пикселей - по заголовку
+    изображения, без распаковки всего растра.
+    """
+
+    chunk_size = 64 * 1024
+    default_error_messages = {
+        'base64': 'Некорректное изображение в base64.',
+        'too_large': 'Размер изображения больше {max_mb} МБ.',
+        'too_many_pixels': (
+            'Изображение больше {max_megapixels} мегапикселей.'
+        ),
+        'format': 'Допустимые форматы: {formats}.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = self.decode_base64(data)
+        elif not isinstance(data, UploadedFile):
+            self.fail('invalid')
+        if data.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.fail_too_large()
+        extension = self.check_image(data)
+        data.name = f'{uuid4()}.{extension}'
+        return super().to_internal_value(data)
+
+    def fail_too_large(self):
+        self.fail(
+            'too_large',
+            max_mb=round(settings.IMAGE_UPLOAD_MAX_BYTES / 2 ** 20, 1),
+        )
+
+    def decode_base64(self, data):
+        header, separator, payload = data.partition(';base64,')
+        if not separator:
+            header, payload = '', data
+        # Base64 с переносами строк (MIME) принимается, как раньше.
+        payload = ''.join(payload.split())
+        padding = len(payload) - len(payload.rstrip('='))
+        if len(payload) * 3 // 4 - padding > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.fail_too_large()
+        content_type = header.partition('data:')[2] or 'image/*'
+        file = DecodedImageFile('image', content_type, 0, None)
+        try:
+            # Длина части кратна 4, поэтому части декодируются
+            # независимо друг от друга.
+            for start in range(0, len(payload), self.chunk_size):
+                file.write(b64decode(
+                    payload[start:start + self.chunk_size], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('base64')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
+    def check_image(self, file):
+        """Формат и число пикселей по заголовку изображения."""
+
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                image_format = image.format
+        except Image.DecompressionBombError:
+            self.fail_too_many_pixels()
+        except OSError:
+            self.fail('invalid_image')
+        finally:
+            file.seek(0)
+        if image_format not in IMAGE_FORMATS:
+            self.fail('format', formats=', '.join(IMAGE_FORMATS))
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.fail_too_many_pixels()
+        return IMAGE_FORMATS[image_format]
+
+    def fail_too_many_pixels(self):
+        self.fail(
+            'too_many_pixels',
+            max_megapixels=settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6,
+        )
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """Список id связанных объектов.
+
+    В отличие от PrimaryKeyRelatedField(many=True) не загружает
+    объекты по одному: существование id проверяет сериализатор,
+    а на чтение id выбираются одним запросом.
+    """
+
+    child = serializers.IntegerField()
+
+    def to_representation(self, value):
+        return list(value.values_list('pk', flat=True))
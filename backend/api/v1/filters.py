@@ -1,10 +1,71 @@
+from django import forms
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
+from rest_framework.filters import SearchFilter
 
-from recipes.models import Ingredient, Recipe
+from foodgram.routers import primary
+from recipes.models import Ingredient, Recipe, Tag
+
+from .cache import get_version
+from .search import ranked_search
 
 User = get_user_model()
 
+RecipeTag = Recipe.tags.through
+
+# (версия 'tags', {slug: id}) - словарь тегов процесса.
+_tag_ids = (None, {})
+
+
+def get_tag_ids():
+    """Словарь {slug: id} тегов, перестраивается при смене
+    версии 'tags' (см. signals.py).
+    """
+
+    global _tag_ids
+    version = get_version('tags')
+    if _tag_ids[0] != version:
+        with primary():
+            _tag_ids = (version, dict(Tag.objects.values_list('slug', 'id')))
+    return _tag_ids[1]
+
+
+class SlugListField(forms.Field):
+    """Все значения повторяющегося параметра (?tags=a&tags=b)
+    без проверки по списку вариантов.
+    """
+
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [str(slug) for slug in value or () if slug]
+
+
+class TagSlugFilter(filters.Filter):
+    """Рецепты хотя бы с одним из тегов.
+
+    Slug переводятся в id по словарю get_tag_ids, рецепты
+    отбираются через EXISTS по таблице связей, поэтому дублей
+    нет и DISTINCT не нужен. Неизвестные slug не дают ошибки:
+    если известных нет, ответ - пустая страница с count 0
+    (проверяется маршрутом recipes-filter-tags-unknown
+    в check_query_budget).
+    """
+
+    field_class = SlugListField
+
+    def filter(self, queryset, value):
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids()
+        ids = {tag_ids[slug] for slug in value if slug in tag_ids}
+        if not ids:
+            return queryset.none()
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            tag_id__in=ids, recipe_id=OuterRef('pk')
+        )))
+
 
 class RecipeFilter(filters.FilterSet):
     """Фильтрация по избранному, автору, списку покупок и тегам."""
@@ -19,8 +80,8 @@ class RecipeFilter(filters.FilterSet):
         method='get_favorite',
         label='Избранные рецепты',
     )
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = TagSlugFilter(
+        field_name='tags',
         label='Тэги',
     )
     is_in_shopping_cart = filters.BooleanFilter(
@@ -38,6 +99,8 @@ class RecipeFilter(filters.FilterSet):
         )
 
     def get_favorite(self, queryset, name, value):
+        if not self.request.user.is_authenticated:
+            return queryset.none() if value else queryset
         if value:
             return queryset.filter(favorites__user=self.request.user)
         return queryset.exclude(
@@ -45,10 +108,15 @@ class RecipeFilter(filters.FilterSet):
         )
 
     def get_is_in_shopping_cart(self, queryset, name, value):
+        if not self.request.user.is_authenticated:
+            return queryset.none() if value else queryset
         if value:
-            return Recipe.objects.filter(
+            return queryset.filter(
                 shopping_list__user=self.request.user
             )
+        return queryset.exclude(
+            shopping_list__user=self.request.user
+        )
 
 
 class IngredientFilter(filters.FilterSet):
@@ -62,3 +130,19 @@ class IngredientFilter(filters.FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+
+class RankedSearchFilter(SearchFilter):
+    """Ранжированный поиск по параметру search.
+
+    Поле поиска задается атрибутом search_field представления,
+    поле tsvector для полнотекстового поиска - search_vector_field.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        return ranked_search(
+            queryset,
+            request.query_params.get(self.search_param, ''),
+            view.search_field,
+            getattr(view, 'search_vector_field', None),
+        )
@@ -1,4 +1,19 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework import mixins, viewsets
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.routers import (is_stuck_to_primary, primary, stick_to_primary,
+                              use_replica)
+
+from .cache import count_lookup, get_version, get_versions, make_key
+from .renderers import ORJSONRenderer, stream_json
 
 
 class CreateListRetrieveViewSet(
@@ -10,3 +25,221 @@ class CreateListRetrieveViewSet(
     """Миксин для создания и получения объектов."""
 
     pass
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы читают из реплики (foodgram/routers.py).
+
+    Решение принимается после аутентификации: пользователь,
+    недавно изменивший данные, читает из основной БД, а после
+    каждой успешной записи этот срок продлевается.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (request.method in SAFE_METHODS
+                and not is_stuck_to_primary(request.user)):
+            use_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            stick_to_primary(request.user)
+        return response
+
+
+class StreamingListMixin:
+    """Отдает большие списки потоком: элементы сериализуются
+    порциями по stream_chunk_size и кодируются по мере отправки.
+
+    Поток используется для списков без пагинации и для страниц
+    от STREAMING_MIN_ITEMS элементов, если ответ кодирует
+    ORJSONRenderer и не сохраняется в кеш. Тело ответа
+    совпадает с обычным.
+    """
+
+    stream_chunk_size = 100
+
+    def can_stream(self, request):
+        return (
+            request.method == 'GET'
+            and isinstance(request.accepted_renderer, ORJSONRenderer)
+            and getattr(self, 'response_cache_key', None) is None
+        )
+
+    def serialize_items(self, objects):
+        return self.get_serializer(objects, many=True).data
+
+    def iter_serialized(self, objects, serialize):
+        chunk = []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) == self.stream_chunk_size:
+                yield from serialize(chunk)
+                chunk = []
+        if chunk:
+            yield from serialize(chunk)
+
+    def stream_response(self, objects, serialize, envelope=None):
+        return StreamingHttpResponse(
+            stream_json(self.iter_serialized(objects, serialize), envelope),
+            content_type=self.request.accepted_renderer.media_type,
+        )
+
+    def list_response(self, page, serialize=None):
+        """get_paginated_response для страницы page, а для большой
+        страницы - потоковый ответ с теми же полями.
+        """
+
+        serialize = serialize or self.serialize_items
+        if (len(page) < settings.STREAMING_MIN_ITEMS
+                or not self.can_stream(self.request)):
+            return self.get_paginated_response(serialize(page))
+        envelope = self.get_paginated_response(None).data
+        return self.stream_response(page, serialize, envelope)
+
+    def list(self, request, *args, **kwargs):
+        if not self.can_stream(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.list_response(page)
+        if not queryset._prefetch_related_lookups:
+            queryset = queryset.iterator(chunk_size=self.stream_chunk_size)
+        return self.stream_response(queryset, self.serialize_items)
+
+
+class PrecomputedPayload:
+    """Готовое тело ответа со сжатой копией и валидаторами."""
+
+    def __init__(self, body, version):
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=9, mtime=0)
+        digest = hashlib.sha256(body).hexdigest()
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.last_modified = version // 10 ** 9
+
+
+class PrecomputedListMixin:
+    """Отдает список без параметров запроса из заранее
+    сериализованного и сжатого тела с ETag и Last-Modified.
+
+    Тело кодируется без отступов независимо от Accept первого
+    запроса и пересобирается при смене версии payload_version
+    (см. signals.py), на совпадающие валидаторы клиента
+    отвечает 304 Not Modified.
+    """
+
+    payload_version = None
+    _payloads = {}
+
+    def get_payload(self):
+        version = get_version(self.payload_version)
+        cached = self._payloads.get(self.payload_version)
+        if cached is None or cached[0] != version:
+            with primary():
+                serializer = self.get_serializer(
+                    self.filter_queryset(self.get_queryset()), many=True
+                )
+                body = ORJSONRenderer().render(serializer.data)
+            cached = (version, PrecomputedPayload(body, version))
+            self._payloads[self.payload_version] = cached
+        return cached[1]
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        payload = self.get_payload()
+        use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        etag = payload.gzip_etag if use_gzip else payload.etag
+        response = get_conditional_response(
+            request, etag=etag, last_modified=payload.last_modified,
+        )
+        if response is None:
+            response = HttpResponse(
+                payload.gzip_body if use_gzip else payload.body,
+                content_type=request.accepted_renderer.media_type,
+            )
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(payload.last_modified)
+        response['Cache-Control'] = (
+            f'public, max-age={settings.REFERENCE_DATA_MAX_AGE}'
+        )
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует готовые ответы list и retrieve для анонимных
+    пользователей.
+
+    Ключ включает нормализованные параметры запроса и версии
+    данных: list_versions для списка и detail_versions для объекта
+    ({pk} подставляется). Версии повышаются после коммита каждого
+    изменения (см. signals.py), поэтому устаревший ответ не
+    находится по новому ключу. Ответ для кеша собирается
+    из основной БД, чтобы под новой версией не сохранились данные
+    отстающей реплики. Попадания и промахи считаются в статистике
+    cache_name и видны в заголовке X-Cache.
+    """
+
+    cache_name = None
+    list_versions = ()
+    detail_versions = ()
+
+    def get_response_cache_key(self, request, versions):
+        if (request.method != 'GET' or request.user.is_authenticated
+                or request.accepted_renderer.format != 'json'):
+            return None
+        return make_key(
+            f'response:{self.cache_name}', request,
+            *get_versions(*(
+                name.format(pk=self.kwargs.get(self.lookup_field))
+                for name in versions
+            ))
+        )
+
+    def cached_response(self, request, versions, handler, *args, **kwargs):
+        key = self.get_response_cache_key(request, versions)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        cached = cache.get(key)
+        count_lookup(self.cache_name, cached is not None)
+        if cached is None:
+            self.response_cache_key = key
+            with primary():
+                return handler(request, *args, **kwargs)
+        content_type, body = cached
+        response = HttpResponse(body, content_type=content_type)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, self.list_versions, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, self.detail_versions, super().retrieve, *args, **kwargs
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        key = getattr(self, 'response_cache_key', None)
+        if key is not None and response.status_code == 200:
+            response.render()
+            cache.set(
+                key, (response['Content-Type'], response.content),
+                settings.RESPONSE_CACHE_TIMEOUT,
+            )
+            response['X-Cache'] = 'MISS'
+        return response
@@ -1,5 +1,314 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
 
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet, ImproperlyConfigured
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, LimitOffsetPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-class LimitPageNumberPaginator(PageNumberPagination):
+
+def estimate_count(queryset, threshold):
+    """Оценка числа строк по статистике планировщика PostgreSQL.
+
+    Для пустой выборки (queryset.none()) возвращается 0, для выборки
+    без условий берется reltuples таблицы, иначе оценка строк
+    из EXPLAIN. Если оценка меньше threshold или СУБД
+    не PostgreSQL, выполняется точный COUNT(*).
+    """
+
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    if queryset.query.is_empty():
+        return 0
+    queryset = queryset.order_by()
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            estimate = row[0] if row else -1
+        else:
+            try:
+                sql, params = queryset.values('pk').query.sql_with_params()
+            except EmptyResultSet:
+                # Условие заведомо ложно, например pk__in=[].
+                return 0
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]['Plan']['Plan Rows']
+    if estimate < threshold:
+        return queryset.count()
+    return int(estimate)
+
+
+class CountStrategyMixin:
+    """Выбор способа подсчета строк для пагинации.
+
+    Представление задает count_strategy:
+    'exact' - точный COUNT(*);
+    'estimate' - оценка планировщика для больших выборок;
+    'has_more' - без подсчета, запрашивается limit + 1 строка,
+    а count в ответе равен null.
+    """
+
+    count_strategy = 'exact'
+    count_strategies = ('exact', 'estimate', 'has_more')
+
+    def get_count_strategy(self, view):
+        strategy = getattr(view, 'count_strategy', self.count_strategy)
+        if strategy not in self.count_strategies:
+            raise ImproperlyConfigured(
+                f'Неизвестный способ подсчета {strategy!r}'
+            )
+        return strategy
+
+    def count_queryset(self, queryset):
+        if self.strategy == 'estimate':
+            return estimate_count(
+                queryset, settings.PAGINATION_ESTIMATE_THRESHOLD
+            )
+        return queryset.count()
+
+    def fetch_window(self, queryset, offset, limit):
+        """Строки страницы и признак наличия следующей
+        без подсчета всей выборки.
+        """
+
+        rows = list(queryset[offset:offset + limit + 1])
+        self.has_more = len(rows) > limit
+        self.display_page_controls = False
+        return rows[:limit]
+
+
+class LimitOffsetPaginator(CountStrategyMixin, LimitOffsetPagination):
+    """LimitOffsetPagination с выбором способа подсчета."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.strategy = self.get_count_strategy(view)
+        if self.strategy != 'has_more':
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = None
+        return self.fetch_window(queryset, self.offset, self.limit)
+
+    def get_count(self, queryset):
+        return self.count_queryset(queryset)
+
+    def get_next_link(self):
+        if self.strategy != 'has_more':
+            return super().get_next_link()
+        if not self.has_more:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+
+class CountingDjangoPaginator(DjangoPaginator):
+    """Paginator, который считает строки через count_queryset."""
+
+    def __init__(self, *args, count_queryset, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+        return self.count_queryset(self.object_list)
+
+
+class LimitPageNumberPaginator(CountStrategyMixin, PageNumberPagination):
+    page_size_query_param = 'limit'
+
+    def django_paginator_class(self, *args, **kwargs):
+        return CountingDjangoPaginator(
+            *args, count_queryset=self.count_queryset, **kwargs
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.strategy = self.get_count_strategy(view)
+        if self.strategy != 'has_more':
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = max(1, int(
+                request.query_params.get(self.page_query_param, 1)
+            ))
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='Номер страницы должен быть числом.',
+            ))
+        self.page_size = page_size
+        return self.fetch_window(
+            queryset, (self.page_number - 1) * page_size, page_size
+        )
+
+    def get_next_link(self):
+        if self.strategy != 'has_more':
+            return super().get_next_link()
+        if not self.has_more:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.page_query_param, self.page_number + 1
+        )
+
+    def get_previous_link(self):
+        if self.strategy != 'has_more':
+            return super().get_previous_link()
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1
+        )
+
+    def get_paginated_response(self, data):
+        if self.strategy != 'has_more':
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class KeysetPaginator(BasePagination):
+    """Пагинация по ключу (pub_date, id) от новых к старым.
+
+    Вместо OFFSET и COUNT(*) страница выбирается условием
+    (pub_date, id) < (курсор) по составному индексу, поэтому
+    глубокие страницы не медленнее первой. Курсоры непрозрачны,
+    limit ограничен max_page_size.
+    """
+
+    cursor_query_param = 'cursor'
     page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    date_field = 'pub_date'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        date, pk = self.date_field, 'pk'
+        if cursor is None:
+            reverse = False
+        else:
+            position, pk_value, reverse = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    **{f'{date}__gte': position}
+                ).filter(
+                    Q(**{f'{date}__gt': position}) | Q(pk__gt=pk_value)
+                )
+            else:
+                queryset = queryset.filter(
+                    **{f'{date}__lte': position}
+                ).filter(
+                    Q(**{f'{date}__lt': position}) | Q(pk__lt=pk_value)
+                )
+        if reverse:
+            queryset = queryset.order_by(date, pk)
+        else:
+            queryset = queryset.order_by(f'-{date}', f'-{pk}')
+
+        page = list(queryset[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        if reverse:
+            page.reverse()
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None and (has_more or not reverse)
+        self.page = page
+        return page
+
+    def get_page_size(self, request):
+        try:
+            limit = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(limit, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position, pk_value, reverse = json.loads(
+                urlsafe_b64decode(encoded.encode('ascii'))
+            )
+            position = parse_datetime(position)
+            pk_value = int(pk_value)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if position is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position, pk_value, bool(reverse)
+
+    def encode_cursor(self, obj, reverse):
+        position = getattr(obj, self.date_field).isoformat()
+        encoded = urlsafe_b64encode(
+            json.dumps([position, obj.pk, int(reverse)]).encode('ascii')
+        ).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
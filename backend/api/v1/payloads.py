@@ -0,0 +1,107 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import IntegerField, Value
+
+from foodgram.routers import primary
+from recipes.models import FavoritesList, Recipe, ShoppingList
+from users.models import Follow
+
+from .cache import count_lookup, get_versions
+from .serializers import RecipeGetSerializer
+
+FAVORITED, IN_SHOPPING_CART, SUBSCRIBED = range(3)
+
+
+def payload_keys(recipe_ids, request):
+    """Ключи представлений рецептов для текущих версий данных.
+
+    Адреса изображений абсолютные, поэтому в ключ входит хост.
+    """
+
+    host = hashlib.sha256(
+        f'{request.scheme}://{request.get_host()}'.encode()
+    ).hexdigest()[:16]
+    *recipe_versions, tags, ingredients = get_versions(
+        *(f'recipe:{pk}' for pk in recipe_ids), 'tags', 'ingredients'
+    )
+    return {
+        pk: f'payload:recipe:{host}:{pk}:{version}:{tags}:{ingredients}'
+        for pk, version in zip(recipe_ids, recipe_versions)
+    }
+
+
+def get_recipe_payloads(recipe_ids, context):
+    """Представления рецептов без пользовательских флагов.
+
+    Готовые берутся из кеша одним запросом, остальные
+    сериализуются из основной БД и сохраняются. Возвращает словарь
+    {id: представление} только для существующих рецептов.
+    """
+
+    keys = payload_keys(recipe_ids, context['request'])
+    cached = cache.get_many(keys.values())
+    payloads = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [pk for pk in recipe_ids if pk not in payloads]
+    count_lookup('recipe-payloads', True, len(payloads))
+    count_lookup('recipe-payloads', False, len(missing))
+    if missing:
+        anonymous = AnonymousUser()
+        with primary():
+            recipes = list(Recipe.objects.filter(pk__in=missing).defer(
+                'search_vector'
+            ).with_user_flags(anonymous).with_related(anonymous))
+        for recipe in recipes:
+            recipe.author.is_subscribed = False
+        serialized = {
+            payload['id']: payload for payload in RecipeGetSerializer(
+                recipes, many=True, context=context
+            ).data
+        }
+        cache.set_many(
+            {keys[pk]: payload for pk, payload in serialized.items()},
+            settings.RESPONSE_CACHE_TIMEOUT,
+        )
+        payloads.update(serialized)
+    return payloads
+
+
+def overlay_user_flags(payloads, user):
+    """Проставляет флаги избранного, корзины и подписки одним
+    запросом по рецептам и авторам страницы.
+    """
+
+    if not payloads or not user.is_authenticated:
+        return payloads
+    recipe_ids = [payload['id'] for payload in payloads]
+    author_ids = {payload['author']['id'] for payload in payloads}
+    flags = set(FavoritesList.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).annotate(
+        kind=Value(FAVORITED, output_field=IntegerField())
+    ).values_list('kind', 'recipe_id').union(
+        ShoppingList.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).annotate(
+            kind=Value(IN_SHOPPING_CART, output_field=IntegerField())
+        ).values_list('kind', 'recipe_id'),
+        Follow.objects.filter(
+            user=user, author_id__in=author_ids
+        ).annotate(
+            kind=Value(SUBSCRIBED, output_field=IntegerField())
+        ).values_list('kind', 'author_id'),
+        all=True,
+    ))
+    for payload in payloads:
+        payload['is_favorited'] = (FAVORITED, payload['id']) in flags
+        payload['is_in_shopping_cart'] = (
+            (IN_SHOPPING_CART, payload['id']) in flags
+        )
+        payload['author']['is_subscribed'] = (
+            (SUBSCRIBED, payload['author']['id']) in flags
+        )
+    return payloads
@@ -0,0 +1,80 @@
+import orjson
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from ..instrumentation import timer
+
+# Типы, которые orjson кодирует иначе, чем JSONRenderer, передаются
+# в JSONEncoder.default: даты и время DRF пишет по-своему.
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Кодирует data так же, как JSONRenderer без отступов.
+
+    JSONRenderer экранирует U+2028 и U+2029 для встраивания
+    в JavaScript, orjson - нет. Числа с плавающей точкой
+    с экспонентой orjson пишет без знака (1e16), но в схеме API
+    таких полей нет.
+    """
+
+    content = orjson.dumps(data, default=_encoder.default, option=OPTIONS)
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(
+            b'\xe2\x80\xa8', b'\\u2028'
+        ).replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson с тем же телом ответа.
+
+    С отступами (Accept: application/json; indent=4) и для данных,
+    которые orjson не кодирует, используется JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            with timer('render'):
+                return dumps(data)
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+
+
+def stream_json(items, envelope=None, key='results'):
+    """Кодирует список items по частям не меньше
+    STREAMING_BUFFER_SIZE байт.
+
+    Если передан envelope (ответ пагинатора), items подставляются
+    в его последний ключ key. Склеенные части совпадают
+    с ORJSONRenderer().render() для того же списка.
+    """
+
+    head, tail = b'[', b']'
+    if envelope is not None:
+        body = dumps({**envelope, key: []})
+        if list(envelope)[-1] != key or not body.endswith(b'[]}'):
+            raise ValueError(f'Ключ {key} должен быть последним.')
+        head, tail = body[:-2], b']}'
+    buffer = bytearray(head)
+    separator = b''
+    for item in items:
+        buffer += separator
+        buffer += dumps(item)
+        separator = b','
+        if len(buffer) >= settings.STREAMING_BUFFER_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += tail
+    yield bytes(buffer)
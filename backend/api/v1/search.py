@@ -0,0 +1,44 @@
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+
+SEARCH_CONFIG = 'russian'
+
+
+def ranked_search(queryset, term, field, vector_field=None):
+    """Ищет term в поле field и сортирует результаты:
+    сначала совпадения с начала строки, затем вхождения подстроки,
+    затем полнотекстовые (по vector_field) и нечеткие совпадения.
+
+    Полнотекстовый и нечеткий поиск работают только в PostgreSQL
+    (индексы pg_trgm и tsvector создаются миграциями), в остальных
+    СУБД остаются совпадения по началу строки и подстроке.
+    """
+
+    term = term.strip()
+    if not term:
+        return queryset
+    prefix = Q(**{f'{field}__istartswith': term})
+    substring = Q(**{f'{field}__icontains': term})
+    tiers = [When(prefix, then=Value(0)), When(substring, then=Value(1))]
+    matches = substring
+    score = Value(0.0, output_field=FloatField())
+    if connections[queryset.db].vendor == 'postgresql':
+        if vector_field:
+            query = SearchQuery(
+                term, config=SEARCH_CONFIG, search_type='websearch'
+            )
+            full_text = Q(**{vector_field: query})
+            tiers.append(When(full_text, then=Value(2)))
+            matches |= full_text
+            score = SearchRank(F(vector_field), query)
+        matches |= Q(**{f'{field}__trigram_similar': term})
+        score = score + TrigramSimilarity(field, term)
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.filter(matches).annotate(
+        search_tier=Case(
+            *tiers, default=Value(3), output_field=IntegerField()
+        ),
+        search_score=score,
+    ).order_by('search_tier', '-search_score', *ordering)
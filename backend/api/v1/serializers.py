@@ -1,16 +1,23 @@
+import json
 import re
 
 from django.core.exceptions import ValidationError
-from django.db.models import F
+from django.db import transaction
+from django.http import QueryDict
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
+from recipes.images import variant_urls
 from recipes.models import (FavoritesList, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingList, Tag)
+                            RecipeIngredient, ShoppingList,
+                            ShoppingListIngredient, Tag)
 from users.models import Follow, User
 
+from .fields import PrimaryKeyListField, RecipeImageField
+from .utils import (get_recipes_limit, get_subscriptions,
+                    prefetch_subscription_recipes)
+
 
 class UserReadSerializer(UserSerializer):
     """Серилизатор для вывода пользователей."""
@@ -27,9 +34,11 @@ class UserReadSerializer(UserSerializer):
         if not request:
             return False
         user = request.user
-        if user.is_authenticated:
-            return Follow.objects.filter(user=user, author=obj).exists()
-        return False
+        if not user.is_authenticated:
+            return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return Follow.objects.filter(user=user, author=obj).exists()
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -77,7 +86,8 @@ class TagSerializer(serializers.ModelSerializer):
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Серилизатор для краткого вывода рецептов."""
 
-    image = Base64ImageField(required=True, allow_null=False)
+    image = serializers.ImageField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -85,9 +95,13 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         )
 
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
 
 class RecipeIngredientGetSerializer(serializers.ModelSerializer):
     """Получение ингредиентов в рецепте."""
@@ -95,7 +109,7 @@ class RecipeIngredientGetSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
-        source='ingredient.measurements_unit'
+        source='ingredient.measurement_unit'
     )
 
     class Meta:
@@ -128,7 +142,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField(required=True, allow_null=False)
+    image = serializers.ImageField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -141,21 +156,28 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
-        user = request.user
-        if not request or not user.is_authenticated:
+        if not request or not request.user.is_authenticated:
             return False
-        return obj.favorites.filter(user=user).exists()
+        return obj.favorites.filter(user=request.user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
-        user = request.user
-        if not request or not user.is_authenticated:
+        user = request.user if request else None
+        if not user or not user.is_authenticated:
             return False
         shopping_list = ShoppingList.objects.filter(
             user=user, recipe=obj
@@ -184,30 +206,13 @@ class AddIngredientRecipeSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def validate(self, attrs):
-        """
-        Проверяем, что ингредиент не добавлен уже в рецепт.
-        """
-
-        request = self.context.get('request')
-        recipe_id = request.GET.get('recipe')
-        ingredient_id = attrs['ingredient']['id']
-        existing_ingredients = RecipeIngredient.objects.filter(
-            recipe_id=recipe_id,
-            ingredient_id=ingredient_id
-        )
-        if existing_ingredients.exists():
-            raise ValidationError('Ингредиент уже добавлен в рецепт')
-        return attrs
-
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Создание и обновление рецептов."""
 
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all())
+    tags = PrimaryKeyListField()
     ingredients = AddIngredientRecipeSerializer(many=True)
-    image = Base64ImageField(required=True, allow_null=False)
+    image = RecipeImageField(required=True, allow_null=False)
 
     class Meta:
         model = Recipe
@@ -229,35 +234,134 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def add_ingredients(self, recipe, ingredients_data):
-        ingredients = []
-        for ingredient_data in ingredients_data:
+    def to_internal_value(self, data):
+        """В multipart/form-data ингредиенты передаются строкой JSON,
+        а теги - повторяющимся полем или строкой JSON.
+        """
+
+        if isinstance(data, QueryDict):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_form_data(data):
+        parsed = data.dict()
+        for field in ('ingredients', 'tags'):
+            if field not in data:
+                continue
+            values = data.getlist(field)
+            if len(values) == 1:
+                try:
+                    value = json.loads(values[0])
+                except ValueError:
+                    value = None
+                if isinstance(value, list):
+                    values = value
+                elif field == 'ingredients':
+                    raise serializers.ValidationError(
+                        {field: 'Ожидается список в формате JSON.'}
+                    )
+            parsed[field] = values
+        return parsed
+
+    def validate_ingredients(self, value):
+        """Объединяем повторы и проверяем все id одним запросом.
+
+        Возвращает словарь {id ингредиента: количество}.
+        """
+
+        amounts = {}
+        for ingredient_data in value:
             ingredient_id = ingredient_data['ingredient']['id']
-            amount = ingredient_data['amount']
-            ingredient = Ingredient.objects.get(id=ingredient_id)
-            if RecipeIngredient.objects.filter(
-                    recipe=recipe, ingredient=ingredient_id).exists():
-                amount += F('amount')
-            recipe_ingredient = RecipeIngredient(
-                recipe=recipe, ingredient=ingredient, amount=amount
+            amounts[ingredient_id] = (
+                amounts.get(ingredient_id, 0) + ingredient_data['amount']
             )
-            ingredients.append(recipe_ingredient)
-        RecipeIngredient.objects.bulk_create(ingredients)
+        if not amounts:
+            raise ValidationError('Нужен хотя бы один ингредиент')
+        missing = amounts.keys() - set(Ingredient.objects.filter(
+            id__in=amounts
+        ).values_list('id', flat=True))
+        if missing:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {sorted(missing)}'
+            )
+        return amounts
+
+    def validate_tags(self, value):
+        """Проверяем все id тегов одним запросом."""
+
+        tag_ids = list(dict.fromkeys(value))
+        missing = set(tag_ids) - set(Tag.objects.filter(
+            id__in=tag_ids
+        ).values_list('id', flat=True))
+        if missing:
+            raise ValidationError(f'Теги не найдены: {sorted(missing)}')
+        return tag_ids
+
+    def set_ingredients(self, recipe, amounts, created=False):
+        """Заменяет состав рецепта целиком и переносит разницу
+        в списки покупок одним запросом. Возвращает True, если
+        состав изменился.
+
+        Строки удаляются и создаются без сигналов RecipeIngredient;
+        кэш ответов сбрасывает post_save рецепта.
+        """
+
+        items = [
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+        ]
+        if created:
+            RecipeIngredient.objects.bulk_create(items)
+            return True
+        current_items = RecipeIngredient.objects.filter(recipe=recipe)
+        current = dict(current_items.values_list('ingredient_id', 'amount'))
+        if current == amounts:
+            return False
+        current_items._raw_delete(current_items.db)
+        RecipeIngredient.objects.bulk_create(items)
+        ShoppingListIngredient.objects.apply_amounts(recipe.id, {
+            ingredient_id: (
+                amounts.get(ingredient_id, 0) - current.get(ingredient_id, 0)
+            )
+            for ingredient_id in amounts.keys() | current.keys()
+        })
+        return True
+
+    def set_tags(self, recipe, tag_ids, created=False):
+        """Записывает теги рецепта без чтения текущих:
+        лишние удаляются, недостающие добавляются с ignore_conflicts.
+        """
 
+        RecipeTag = Recipe.tags.through
+        if not created:
+            RecipeTag.objects.filter(recipe=recipe).exclude(
+                tag_id__in=tag_ids
+            ).delete()
+        RecipeTag.objects.bulk_create(
+            [RecipeTag(recipe=recipe, tag_id=tag_id) for tag_id in tag_ids],
+            ignore_conflicts=not created,
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
+        ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        self.add_ingredients(recipe, ingredients_data)
-        recipe.tags.set(tags)
+        self.set_ingredients(recipe, ingredients, created=True)
+        self.set_tags(recipe, tags, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients', [])
-        tags = validated_data.pop('tags')
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.add_ingredients(instance, ingredients)
-        instance.tags.set(tags)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if ingredients is not None:
+            self.set_ingredients(instance, ingredients)
+        if tags is not None:
+            self.set_tags(instance, tags)
         return super().update(instance, validated_data)
 
 
@@ -277,6 +381,7 @@ class FavoritesListSerializer(serializers.Serializer):
             )
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         recipe = get_object_or_404(Recipe, pk=validated_data['id'])
         user = self.context['request'].user
@@ -288,10 +393,7 @@ class FavoritesListSerializer(serializers.Serializer):
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Просмотр списка подписок пользователя."""
 
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     recipes = serializers.SerializerMethodField(read_only=True)
 
@@ -305,15 +407,19 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         if not request or not user.is_authenticated:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return obj.following.filter(user=user).exists()
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        limit_recipes = request.query_params.get('recipes_limit')
-        if limit_recipes is not None:
-            recipes = obj.recipes.all()[:(int(limit_recipes))]
+        if hasattr(obj, 'subscription_recipes'):
+            recipes = obj.subscription_recipes
         else:
             recipes = obj.recipes.all()
+            limit_recipes = get_recipes_limit(request)
+            if limit_recipes is not None:
+                recipes = recipes[:limit_recipes]
         context = {'request': request}
         return ShortRecipeSerializer(recipes, many=True,
                                      context=context).data
@@ -323,7 +429,8 @@ class SubscribeSerializer(serializers.Serializer):
     """Добавление и удаление подписок пользователя."""
 
     def validate(self, data):
-        user = self.context.get('request').user
+        request = self.context.get('request')
+        user = request.user
         author = get_object_or_404(User, pk=self.context['id'])
         if user == author:
             raise serializers.ValidationError(
@@ -333,12 +440,17 @@ class SubscribeSerializer(serializers.Serializer):
             raise serializers.ValidationError(
                 'Вы уже подписаны на этого пользователя'
             )
+        data['recipes_limit'] = get_recipes_limit(request)
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         user = self.context.get('request').user
-        author = get_object_or_404(User, pk=validated_data['id'])
-        Follow.objects.create(user=user, author=author)
+        Follow.objects.create(user=user, author_id=validated_data['id'])
+        author = get_subscriptions(user).get(pk=validated_data['id'])
+        prefetch_subscription_recipes(
+            [author], validated_data['recipes_limit']
+        )
         serializer = SubscriptionSerializer(
             author, context={'request': self.context.get('request')}
         )
@@ -359,6 +471,7 @@ class ShoppingCartSerializer(serializers.Serializer):
             )
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         recipe = get_object_or_404(Recipe, pk=validated_data['id'])
         ShoppingList.objects.create(
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.images import image_variants_ready
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import ingredients_loaded
+from users.models import User
+
+from .cache import bump_version, bump_versions
+
+# Поля пользователя, которые не попадают в ответы с рецептами.
+PRIVATE_USER_FIELDS = {'last_login', 'password'}
+
+
+@receiver(ingredients_loaded)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('ingredients'))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+
+
+def invalidate_recipes(*recipe_ids):
+    """После коммита помечает устаревшими список рецептов
+    и ответы по рецептам recipe_ids.
+    """
+
+    names = ['recipes', *(f'recipe:{pk}' for pk in recipe_ids)]
+    transaction.on_commit(lambda: bump_versions(*names))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate_recipes(instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    invalidate_recipes(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_recipes(instance.pk)
+    elif action == 'pre_clear':
+        # После очистки связи с тегом уже не найти.
+        instance._cleared_recipe_ids = list(
+            instance.recipes.values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        invalidate_recipes(*instance.__dict__.pop('_cleared_recipe_ids', []))
+    elif action.startswith('post_'):
+        invalidate_recipes(*pk_set)
+
+
+@receiver(image_variants_ready)
+def invalidate_recipe_image(sender, recipe_id, **kwargs):
+    invalidate_recipes(recipe_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields=None,
+                      **kwargs):
+    """Данные автора входят в ответы со всеми его рецептами."""
+
+    if created:
+        return
+    if update_fields and set(update_fields) <= PRIVATE_USER_FIELDS:
+        return
+    recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    if recipe_ids:
+        invalidate_recipes(*recipe_ids)
@@ -7,7 +7,7 @@ app_name = 'api_v1'
 
 router = DefaultRouter()
 
-router.register('ingredients', IngredientViewSet, basename='ingridients')
+router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('tags', TagViewSet, basename='tags')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('users', UserViewSet, basename='users')
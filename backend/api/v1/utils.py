@@ -1,23 +1,89 @@
-from django.db.models import Sum
+import csv
 
-from recipes.models import Ingredient, RecipeIngredient
+from django.db.models import (BooleanField, Prefetch, Value,
+                              prefetch_related_objects)
+from rest_framework.exceptions import ValidationError
 
+from recipes.models import Recipe, ShoppingListIngredient
+from users.models import User
 
-def create_shopping_list_report(shopping_cart):
-    recipes = shopping_cart.values_list('recipe_id', flat=True)
-    buy_list = RecipeIngredient.objects.filter(
-        recipe__in=recipes
-    ).values(
-        'ingredient'
-    ).annotate(
-        amount=Sum('amount')
+SHOPPING_LIST_FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_list_items(user):
+    """Сводный список покупок пользователя одним запросом."""
+
+    return ShoppingListIngredient.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name')
+
+
+def create_shopping_list_report(user, file_format='txt'):
+    """Построчно отдает список покупок в формате txt или csv."""
+
+    items = get_shopping_list_items(user).iterator()
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(('Ингредиент', 'Количество', 'Единицы'))
+        for name, measurement_unit, amount in items:
+            yield writer.writerow((name, amount, measurement_unit))
+        return
+    yield 'Foodgram\nСписок покупок:\n'
+    for name, measurement_unit, amount in items:
+        yield f'{name}, {amount} {measurement_unit}\n'
+
+
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit или None."""
+
+    value = request.query_params.get('recipes_limit')
+    if value is None:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise ValidationError({'recipes_limit': (
+            'Ожидается целое неотрицательное число.'
+        )})
+    return limit
+
+
+def get_subscriptions(user):
+    """Авторы, на которых подписан пользователь,
+    с признаком подписки.
+    """
+
+    return User.objects.filter(following__user=user).annotate(
+        is_subscribed=Value(True, output_field=BooleanField()),
     )
-    buy_list_text = 'Foodgram\nСписок покупок:\n'
-    for item in buy_list:
-        ingredient = Ingredient.objects.get(pk=item['ingredient'])
-        amount = item['amount']
-        buy_list_text += (
-            f'{ingredient.name}, {amount} '
-            f'{ingredient.measurement_unit}\n'
-        )
-    return buy_list_text
+
+
+def prefetch_subscription_recipes(authors, recipes_limit=None):
+    """Подгружает в subscription_recipes первые recipes_limit
+    рецептов каждого автора одним запросом.
+    """
+
+    recipes = Recipe.objects.filter(author__in=authors)
+    if recipes_limit is not None:
+        recipes = recipes.first_per_author(recipes_limit)
+    prefetch_related_objects(authors, Prefetch(
+        'recipes',
+        queryset=recipes.only('id', 'name', 'image', 'image_variants',
+                              'cooking_time', 'author_id'),
+        to_attr='subscription_recipes',
+    ))
+    return authors
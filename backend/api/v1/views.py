@@ -1,9 +1,12 @@
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
@@ -11,27 +14,44 @@ from rest_framework.response import Response
 from recipes.models import FavoritesList, Ingredient, Recipe, ShoppingList, Tag
 from users.models import Follow
 
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import CreateListRetrieveViewSet
-from .paginators import LimitPageNumberPaginator
+from .autocomplete import ingredient_index
+from .filters import IngredientFilter, RankedSearchFilter, RecipeFilter
+from .mixins import (AnonymousResponseCacheMixin, CreateListRetrieveViewSet,
+                     PrecomputedListMixin, ReplicaReadMixin,
+                     StreamingListMixin)
+from .paginators import KeysetPaginator, LimitPageNumberPaginator
+from .payloads import get_recipe_payloads, overlay_user_flags
 from .serializers import (FavoritesListSerializer, IngredientSerializer,
                           RecipeCreateSerializer, RecipeGetSerializer,
                           SetPasswordSerializer, ShoppingCartSerializer,
                           SubscribeSerializer, SubscriptionSerializer,
                           TagSerializer, UserCreateSerializer,
                           UserReadSerializer)
-from .utils import create_shopping_list_report
+from .utils import (SHOPPING_LIST_FORMATS, create_shopping_list_report,
+                    get_recipes_limit, get_subscriptions,
+                    prefetch_subscription_recipes)
 
 User = get_user_model()
 
 
-class UserViewSet(CreateListRetrieveViewSet):
+class UserViewSet(ReplicaReadMixin, StreamingListMixin,
+                  CreateListRetrieveViewSet):
     queryset = User.objects.all()
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter)
-    search_fields = ('username',)
+    filter_backends = (DjangoFilterBackend, RankedSearchFilter)
+    search_field = 'username'
+    count_strategy = 'exact'
     filterset_fields = ('username',)
     permission_classes = (AllowAny,)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action in ('list', 'retrieve') and user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return UserReadSerializer
@@ -72,7 +92,7 @@ class UserViewSet(CreateListRetrieveViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=('password',))
         return Response('Пароль успешно изменен', status=status.HTTP_200_OK)
 
     @action(
@@ -80,20 +100,24 @@ class UserViewSet(CreateListRetrieveViewSet):
         detail=False,
         serializer_class=SubscriptionSerializer,
         permission_classes=(IsAuthenticated,),
-        pagination_class=LimitPageNumberPaginator
+        pagination_class=LimitPageNumberPaginator,
+        count_strategy='exact',
     )
     def subscriptions(self, request):
         """Просмотр подписок пользователя."""
 
-        user = request.user
-        subscriptions = user.follower.all()
-        users_id = subscriptions.values_list('author_id', flat=True)
-        users = User.objects.filter(id__in=users_id)
-        paginated_queryset = self.paginate_queryset(users)
-        serializer = self.serializer_class(paginated_queryset,
-                                           context={'request': request},
-                                           many=True)
-        return self.get_paginated_response(serializer.data)
+        recipes_limit = get_recipes_limit(request)
+        paginated_queryset = self.paginate_queryset(
+            get_subscriptions(request.user)
+        )
+
+        def serialize(authors):
+            prefetch_subscription_recipes(authors, recipes_limit)
+            return self.serializer_class(
+                authors, context={'request': request}, many=True
+            ).data
+
+        return self.list_response(paginated_queryset, serialize)
 
     @action(detail=True,
             methods=('post', 'delete'),
@@ -127,9 +151,13 @@ class UserViewSet(CreateListRetrieveViewSet):
             )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, AnonymousResponseCacheMixin,
+                    StreamingListMixin, viewsets.ModelViewSet):
     """Работа с рецептами."""
 
+    cache_name = 'recipes'
+    list_versions = ('recipes', 'tags', 'ingredients')
+    detail_versions = ('recipe:{pk}', 'tags', 'ingredients')
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     http_method_names = [
@@ -138,9 +166,97 @@ class RecipeViewSet(viewsets.ModelViewSet):
         'patch',
         'delete',
     ]
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RankedSearchFilter)
     filterset_class = RecipeFilter
+    search_field = 'name'
+    search_vector_field = 'search_vector'
     pagination_class = LimitPageNumberPaginator
+    count_strategy = 'estimate'
+
+    @property
+    def paginator(self):
+        """Постраничный вывод по номеру страницы, а с параметром
+        pagination=cursor (или cursor=...) - по ключу.
+
+        Курсор сортирует по (pub_date, id), поэтому при поиске
+        он игнорируется и порядок по релевантности сохраняется.
+        """
+
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            searching = params.get(
+                RankedSearchFilter.search_param, ''
+            ).strip()
+            if not searching and (
+                'cursor' in params or params.get('pagination') == 'cursor'
+            ):
+                self._paginator = KeysetPaginator()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def use_payload_cache(self):
+        return (self.action in ('list', 'retrieve')
+                and self.request.accepted_renderer.format == 'json')
+
+    def get_queryset(self):
+        """Список и рецепт отдаются за фиксированное число запросов."""
+
+        queryset = super().get_queryset().defer('search_vector')
+        if self.use_payload_cache():
+            return queryset.only('id', 'pub_date', 'author_id')
+        if self.action in ('list', 'retrieve'):
+            user = self.request.user
+            queryset = queryset.with_user_flags(user).with_related(user)
+        return queryset
+
+    def get_payloads(self, recipe_ids):
+        """Представления рецептов из общего кеша с флагами
+        текущего пользователя.
+        """
+
+        payloads = get_recipe_payloads(
+            recipe_ids, self.get_serializer_context()
+        )
+        return overlay_user_flags(
+            [payloads[pk] for pk in recipe_ids if pk in payloads],
+            self.request.user,
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_payload_cache():
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(request, self.list_versions,
+                                    self.list_payloads, *args, **kwargs)
+
+    def list_payloads(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(
+                self.get_payloads([recipe.pk for recipe in queryset])
+            )
+        return self.list_response(
+            page, lambda recipes: self.get_payloads(
+                [recipe.pk for recipe in recipes]
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_payload_cache():
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_response(request, self.detail_versions,
+                                    self.retrieve_payload, *args, **kwargs)
+
+    def retrieve_payload(self, request, *args, **kwargs):
+        try:
+            pk = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        payloads = self.get_payloads([pk])
+        if not payloads:
+            raise Http404
+        return Response(payloads[0])
 
     def get_serializer_class(self):
         """Определение серилизатора."""
@@ -216,6 +332,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
 
+    @transaction.atomic
     def remove_recipe_from_cart(self, request, pk):
         get_object_or_404(
             ShoppingList,
@@ -233,32 +350,63 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def download_shopping_cart(self, request):
-        """Скачивание списка покупок."""
-
-        shopping_cart = ShoppingList.objects.filter(user=self.request.user)
-        buy_list_text = create_shopping_list_report(shopping_cart)
-        response = HttpResponse(buy_list_text, content_type="text/plain")
+        """Скачивание списка покупок.
+
+        Формат выбирается параметром file_format (txt или csv).
+        """
+
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise ValidationError({'file_format': (
+                'Допустимые форматы: '
+                + ', '.join(SHOPPING_LIST_FORMATS)
+            )})
+        response = StreamingHttpResponse(
+            create_shopping_list_report(self.request.user, file_format),
+            content_type=SHOPPING_LIST_FORMATS[file_format],
+        )
         response['Content-Disposition'] = (
-            'attachment; filename=shopping-list.txt'
+            f'attachment; filename=shopping-list.{file_format}'
         )
         return response
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, PrecomputedListMixin,
+                        StreamingListMixin, viewsets.ReadOnlyModelViewSet):
     """Получение списка ингридиентов."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RankedSearchFilter)
     filterset_class = IngredientFilter
+    search_field = 'name'
     pagination_class = None
+    payload_version = 'ingredients'
+
+    def list(self, request, *args, **kwargs):
+        """Поиск только по началу названия обслуживается индексом
+        в памяти: не больше INGREDIENT_SEARCH_LIMIT строк, общее число
+        совпадений - в заголовке X-Total-Count. Вместе с другими
+        параметрами запрос фильтруется обычным образом.
+        """
+
+        params = request.query_params
+        if not params.get('name') or params.keys() != {'name'}:
+            return super().list(request, *args, **kwargs)
+        rows, total = ingredient_index.search(params['name'])
+        # Строки индекса уже совпадают с полями IngredientSerializer.
+        response = Response(rows)
+        response['X-Total-Count'] = str(total)
+        return response
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReplicaReadMixin, PrecomputedListMixin,
+                 StreamingListMixin, viewsets.ReadOnlyModelViewSet):
     """Получение списка тэгов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    payload_version = 'tags'
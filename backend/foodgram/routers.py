@@ -0,0 +1,84 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+# Реплика, из которой читает текущий запрос; None - основная БД.
+_replica = ContextVar('replica', default=None)
+
+
+def use_replica():
+    """Направляет чтение текущего запроса в одну из реплик.
+
+    Реплика выбирается один раз на запрос, чтобы все его чтения
+    видели одно состояние данных. Сбрасывается по окончании
+    запроса, в том числе после отправки потокового ответа.
+    """
+
+    if settings.DATABASE_REPLICAS:
+        _replica.set(random.choice(settings.DATABASE_REPLICAS))
+
+
+def reset_replica(**kwargs):
+    _replica.set(None)
+
+
+request_started.connect(reset_replica)
+request_finished.connect(reset_replica)
+
+
+@contextmanager
+def primary():
+    """Чтение из основной БД внутри блока: для данных, которые
+    сохраняются в кеш и не должны отставать от записи.
+    """
+
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def _sticky_key(user):
+    return f'db:primary:{user.pk}'
+
+
+def stick_to_primary(user):
+    """После записи пользователь REPLICA_STICKY_SECONDS читает
+    из основной БД и видит свои изменения, даже если реплика
+    отстает.
+    """
+
+    if user.is_authenticated and settings.DATABASE_REPLICAS:
+        cache.set(_sticky_key(user), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_stuck_to_primary(user):
+    return user.is_authenticated and bool(cache.get(_sticky_key(user)))
+
+
+class PrimaryReplicaRouter:
+    """Запись, миграции и транзакции - в основной БД, чтение -
+    в реплике, если она выбрана для запроса (use_replica).
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or connections['default'].in_atomic_block:
+            return 'default'
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'drf_yasg',
     'rest_framework',
     'rest_framework.authtoken',
@@ -34,6 +35,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.RequestMetricsMiddleware',
+    'api.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -80,6 +83,58 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host[:port],host[:port].
+# Остальные параметры, кроме DB_REPLICA_NAME, берутся из default.
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.routers.PrimaryReplicaRouter']
+
+# Сколько секунд после записи пользователь читает из основной БД.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+
+# Версии данных, статистика кешей и признак чтения из основной БД
+# должны быть общими для всех процессов gunicorn, поэтому по умолчанию
+# кеш - Redis. LocMemCache подходит только для одного процесса
+# (локальная разработка).
+REDIS_CACHE = 'django_redis.cache.RedisCache'
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', REDIS_CACHE)
+CACHE_OPTIONS = {
+    REDIS_CACHE: {
+        'SOCKET_CONNECT_TIMEOUT': 1,
+        'SOCKET_TIMEOUT': 1,
+        'CONNECTION_POOL_KWARGS': {
+            'max_connections': int(os.getenv('CACHE_MAX_CONNECTIONS', 50)),
+        },
+    },
+    # Вытесняет записи без разбора, в том числе версии данных.
+    'django.core.cache.backends.locmem.LocMemCache': {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+    },
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            'redis://redis:6379/0' if CACHE_BACKEND == REDIS_CACHE else '',
+        ),
+        'OPTIONS': CACHE_OPTIONS.get(CACHE_BACKEND, {}),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME':
@@ -127,7 +182,12 @@ REST_FRAMEWORK = {
         # 'rest_framework.authentication.SessionAuthentication',
     ],
 
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.v1.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PAGINATION_CLASS': 'api.v1.paginators.LimitOffsetPaginator',
     'PAGE_SIZE': 6,
 
     'DEFAULT_FILTER_BACKENDS': [
@@ -135,3 +195,61 @@ REST_FRAMEWORK = {
     ],
 
 }
+
+# Запросы дольше SLOW_REQUEST_MS пишутся в журнал api.instrumentation
+# вместе с SLOW_REQUEST_QUERIES самыми медленными SQL-запросами.
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = int(os.getenv('SLOW_REQUEST_QUERIES', 5))
+
+# Профилирование запросов по токену сотрудника (profile_token):
+# срок действия токена, интервал выборки стеков, сколько хранить.
+PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', 3600))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.002))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 200))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.instrumentation': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+REFERENCE_DATA_MAX_AGE = int(os.getenv('REFERENCE_DATA_MAX_AGE', 60))
+
+# Срок хранения закешированных ответов API, секунды.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600))
+
+# Списки от STREAMING_MIN_ITEMS элементов отдаются потоком
+# частями по STREAMING_BUFFER_SIZE байт.
+STREAMING_MIN_ITEMS = int(os.getenv('STREAMING_MIN_ITEMS', 100))
+STREAMING_BUFFER_SIZE = int(os.getenv('STREAMING_BUFFER_SIZE', 64 * 1024))
+
+PAGINATION_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_ESTIMATE_THRESHOLD', 10000)
+)
+
+# Уменьшенные копии изображений рецептов: размер -> длинная сторона.
+IMAGE_VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1280,
+}
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Ограничения загружаемых изображений рецептов. Размер всего тела
+# запроса (JSON с base64 до +33%) ограничивает nginx client_max_body_size.
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+)
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40000000))
@@ -6,6 +6,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from api.metrics import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title='Foodgram API',
@@ -22,6 +24,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.v1.urls', namespace='api_v1')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 
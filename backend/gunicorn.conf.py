@@ -0,0 +1,17 @@
+import os
+import shutil
+
+
+def on_starting(server):
+    """Очищает метрики Prometheus предыдущего запуска."""
+
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
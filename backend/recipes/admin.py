@@ -17,9 +17,6 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('name', 'author', 'tags')
     exclude = ('ingredients',)
 
-    def favorites_count(self, obj):
-        return obj.favorites.count()
-
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name',)
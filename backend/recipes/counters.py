@@ -0,0 +1,69 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Follow
+
+from .models import FavoritesList, Recipe, ShoppingList
+
+# Модель связи: (поле связи, счетчик в связанной модели).
+COUNTERS = {
+    FavoritesList: ('recipe', 'favorites_count'),
+    ShoppingList: ('recipe', 'shopping_cart_count'),
+    Recipe: ('author', 'recipes_count'),
+    Follow: ('author', 'followers_count'),
+}
+
+
+def get_target(model):
+    """Модель, в которой хранится счетчик связей model."""
+
+    field, _ = COUNTERS[model]
+    return model._meta.get_field(field).related_model
+
+
+def change_counter(instance, delta):
+    """Атомарно меняет счетчик связанной записи на delta.
+
+    Счетчик не уходит ниже нуля, расхождения исправляет
+    команда reconcile_counters.
+    """
+
+    field, counter = COUNTERS[type(instance)]
+    related_id = getattr(instance, f'{field}_id')
+    if related_id is None:
+        return
+    queryset = get_target(type(instance)).objects.filter(pk=related_id)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{counter}__gt': 0})
+    queryset.update(**{counter: F(counter) + delta})
+
+
+def actual_count(model):
+    """Фактическое число связей model для внешнего запроса."""
+
+    field, _ = COUNTERS[model]
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def find_drift(model):
+    """Записи, у которых счетчик связей model разошелся
+    с фактическим числом.
+    """
+
+    _, counter = COUNTERS[model]
+    return get_target(model).objects.annotate(
+        actual=actual_count(model)
+    ).exclude(**{counter: F('actual')})
+
+
+def fix_drift(model):
+    """Пересчитывает разошедшиеся счетчики одним UPDATE."""
+
+    _, counter = COUNTERS[model]
+    return find_drift(model).update(**{counter: actual_count(model)})
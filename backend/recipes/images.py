@@ -0,0 +1,180 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Отправляется, когда копии изображения рецепта сохранены в БД.
+image_variants_ready = Signal()
+
+# Формат: (формат Pillow, расширение, параметры сохранения).
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {
+        'quality': 82, 'optimize': True, 'progressive': True
+    }),
+}
+
+_executor = None
+
+
+def get_executor():
+    """Общий пул потоков для обработки изображений.
+
+    Pillow отпускает GIL при декодировании и масштабировании,
+    поэтому потоков достаточно и запрос не ждет обработки.
+    """
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return _executor
+
+
+def variant_path(source, variant, extension):
+    path = PurePosixPath(source)
+    return f'recipes/variants/{path.stem}-{variant}.{extension}'
+
+
+def render_variants(source):
+    """Сохраняет уменьшенные копии изображения source во всех
+    размерах IMAGE_VARIANTS и форматах FORMATS.
+
+    Возвращает словарь {размер: {формат: путь}}.
+    """
+
+    with default_storage.open(source, 'rb') as file:
+        with Image.open(file) as original:
+            original = ImageOps.exif_transpose(original).convert('RGB')
+    variants = {}
+    for variant, size in settings.IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[variant] = {'width': image.width, 'height': image.height}
+        for name, (image_format, extension, options) in FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, image_format, **options)
+            path = variant_path(source, variant, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[variant][name] = default_storage.save(
+                path, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def variant_files(variants):
+    """Пути файлов копий из значения image_variants."""
+
+    return {
+        path
+        for variant, files in variants.items() if variant != 'source'
+        for name, path in files.items() if name in FORMATS
+    }
+
+
+def delete_variant_files(paths):
+    for path in paths:
+        try:
+            default_storage.delete(path)
+        except OSError:
+            logger.exception('Не удалось удалить копию изображения %s', path)
+
+
+def generate_variants(recipe_id):
+    """Строит копии изображения рецепта и сохраняет их пути
+    в image_variants, если изображение за это время не сменилось.
+
+    Копии прежнего изображения удаляются после замены, а только что
+    построенные - если рецепт за это время изменился или удален.
+    """
+
+    recipe = Recipe.objects.only('image', 'image_variants').filter(
+        pk=recipe_id
+    ).first()
+    if recipe is None or not recipe.image:
+        return False
+    try:
+        variants = render_variants(recipe.image.name)
+    except (OSError, Image.DecompressionBombError):
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+        return False
+    variants = {'source': recipe.image.name, **variants}
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).update(image_variants=variants)
+    if updated:
+        delete_variant_files(
+            variant_files(recipe.image_variants) - variant_files(variants)
+        )
+        image_variants_ready.send(sender=Recipe, recipe_id=recipe_id)
+    else:
+        delete_variant_files(variant_files(variants))
+    return bool(updated)
+
+
+def generate_variants_task(recipe_id):
+    """generate_variants для потока пула: закрывает соединения
+    с БД, открытые в этом потоке.
+    """
+
+    try:
+        return generate_variants(recipe_id)
+    except Exception:
+        logger.exception('Ошибка обработки изображения рецепта %s',
+                         recipe_id)
+        return False
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe_id):
+    """Ставит обработку изображения рецепта в очередь пула."""
+
+    return get_executor().submit(generate_variants_task, recipe_id)
+
+
+def needs_variants(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') != recipe.image.name
+    )
+
+
+def variant_urls(recipe, request=None):
+    """Адреса готовых копий изображения: {размер: {формат: url}}.
+
+    Пока копии не построены, возвращается пустой словарь
+    и клиент использует исходное изображение.
+    """
+
+    variants = recipe.image_variants
+    if not variants or variants.get('source') != recipe.image.name:
+        return {}
+    urls = {}
+    for variant in settings.IMAGE_VARIANTS:
+        if variant not in variants:
+            continue
+        urls[variant] = {
+            'width': variants[variant]['width'],
+            'height': variants[variant]['height'],
+        }
+        for name in FORMATS:
+            url = default_storage.url(variants[variant][name])
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][name] = url
+    return urls
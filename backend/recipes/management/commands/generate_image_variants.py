@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants_task  # isort:skip
+from recipes.images import needs_variants  # isort:skip
+from recipes.models import Recipe  # isort:skip
+
+
+class Command(BaseCommand):
+    """
+    Строим уменьшенные копии изображений рецептов, загруженных
+    до появления фоновой обработки или не обработанных из-за ошибки:
+    python manage.py generate_image_variants [--force] [--workers N]
+    """
+    help = 'Generate resized WebP/JPEG variants of recipe images.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить копии и для уже обработанных изображений.',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.IMAGE_WORKERS,
+            help='Число потоков обработки.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.only('image', 'image_variants').order_by()
+        recipe_ids = [
+            recipe.pk for recipe in recipes.iterator()
+            if recipe.image and (options['force'] or needs_variants(recipe))
+        ]
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(generate_variants_task, recipe_ids))
+        done = sum(results)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, '
+            f'с ошибками: {len(results) - done}.'
+        ))
@@ -1,13 +1,82 @@
-from csv import reader
+import csv
+import io
+import json
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient  # isort:skip
+from recipes.signals import ingredients_loaded  # isort:skip
+
+DEFAULT_PATH = (
+    Path(__file__).resolve().parents[2] / 'data' / 'ingredients.csv'
+)
+MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) == 2:
+            yield row[0], row[1]
+        else:
+            yield None
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Потоково разбирает JSON-массив объектов
+    {"name": ..., "measurement_unit": ...} без загрузки всего файла.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            if isinstance(item, dict):
+                yield item.get('name'), item.get('measurement_unit')
+            else:
+                yield None
+        buffer = buffer[position:]
+        if not chunk:
+            if buffer.strip():
+                raise CommandError('Некорректный JSON в конце файла')
+            return
+
+
+def read_json_lines(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_json_lines,
+}
 
 
 class Command(BaseCommand):
     """
-    Добавляем ингредиенты из файла CSV.
+    Добавляем ингредиенты из файла CSV, JSON или JSON Lines.
     После миграции БД запускаем командой
     python manage.py load_ingredients локально
     или
@@ -16,17 +85,129 @@ class Command(BaseCommand):
     sudo docker compose -f docker-compose.production.yml
     exec backend python manage.py load_ingredients
     на удаленном сервере.
-    Создает записи в модели Ingredients из списка.
+    Файл читается потоково и загружается пачками: в PostgreSQL
+    через COPY во временную таблицу, в остальных СУБД через
+    bulk_create. Уже существующие пары (название, единицы
+    измерения) пропускаются, поэтому команду можно запускать
+    повторно.
     """
-    help = 'Load ingredients data from csv-file to DB.'
-
-    def handle(self, *args, **kwargs):
-        with open(
-                'recipes/data/ingredients.csv', 'r',
-                encoding='UTF-8'
-        ) as ingredients:
-            for row in reader(ingredients):
-                if len(row) == 2:
-                    Ingredient.objects.get_or_create(
-                        name=row[0], measurement_unit=row[1],
-                    )
+    help = 'Load ingredients data from csv/json file to DB.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(DEFAULT_PATH),
+            help='Путь к файлу (по умолчанию recipes/data/ingredients.csv).',
+        )
+        parser.add_argument(
+            '--format', choices=READERS, dest='file_format',
+            help='Формат файла, по умолчанию определяется по расширению.',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать новые и пропущенные записи.',
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже в PostgreSQL.',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['file_format'] or path.suffix.lstrip('.')
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат {file_format!r}, '
+                f'укажите --format ({", ".join(READERS)})'
+            )
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        self.read = self.invalid = 0
+        with open(path, 'r', encoding='UTF-8') as file:
+            rows = self.clean(READERS[file_format](file))
+            if options['dry_run']:
+                inserted = self.count_new(rows, options['batch_size'])
+            elif connection.vendor == 'postgresql' and not options['no_copy']:
+                inserted = self.copy(rows, options['batch_size'])
+            else:
+                inserted = self.bulk_insert(rows, options['batch_size'])
+        if inserted and not options['dry_run']:
+            ingredients_loaded.send(sender=Ingredient, count=inserted)
+        skipped = self.read - self.invalid - inserted
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет добавлено" if options["dry_run"] else "Добавлено"}: '
+            f'{inserted}, пропущено существующих: {skipped}, '
+            f'некорректных строк: {self.invalid}.'
+        ))
+
+    def clean(self, rows):
+        for row in rows:
+            self.read += 1
+            if row is None:
+                self.invalid += 1
+                continue
+            name, measurement_unit = (
+                str(value or '').strip() for value in row
+            )
+            if not (0 < len(name) <= MAX_LENGTH
+                    and 0 < len(measurement_unit) <= MAX_LENGTH):
+                self.invalid += 1
+                continue
+            yield name, measurement_unit
+
+    @staticmethod
+    def batches(rows, batch_size):
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def count_new(self, rows, batch_size):
+        seen = set()
+        new = 0
+        for batch in self.batches(rows, batch_size):
+            existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in batch}
+            ).values_list('name', 'measurement_unit'))
+            for row in batch:
+                if row not in existing and row not in seen:
+                    seen.add(row)
+                    new += 1
+        return new
+
+    def bulk_insert(self, rows, batch_size):
+        before = Ingredient.objects.count()
+        with transaction.atomic():
+            for batch in self.batches(rows, batch_size):
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in batch),
+                    ignore_conflicts=True,
+                )
+        return Ingredient.objects.count() - before
+
+    def copy(self, rows, batch_size):
+        table = Ingredient._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            for batch in self.batches(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_import (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM ingredient_import '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return cursor.rowcount
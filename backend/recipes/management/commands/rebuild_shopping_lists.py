@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListIngredient  # isort:skip
+
+
+class Command(BaseCommand):
+    """
+    Пересчитываем сводные списки покупок из корзин пользователей.
+    Нужна после массовой загрузки данных в обход API
+    или для исправления расхождений:
+    python manage.py rebuild_shopping_lists [--user ID ...]
+    """
+    help = 'Rebuild per-user shopping list ingredient totals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Пересчитать только для пользователя с этим id.',
+        )
+
+    def handle(self, *args, **options):
+        ShoppingListIngredient.objects.rebuild(options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            'Списки покупок пересчитаны: '
+            f'{ShoppingListIngredient.objects.count()} строк.'
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import (COUNTERS, find_drift, fix_drift,  # isort:skip
+                              get_target)
+
+
+class Command(BaseCommand):
+    """
+    Сверяем счетчики избранного, списков покупок, рецептов
+    и подписчиков с фактическим числом связей и исправляем
+    расхождения:
+    python manage.py reconcile_counters [--dry-run]
+    """
+    help = 'Detect and fix drift in denormalized counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения.',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for model, (_, counter) in COUNTERS.items():
+            drifted = find_drift(model).count()
+            total += drifted
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    fix_drift(model)
+            self.stdout.write(
+                f'{get_target(model).__name__}.{counter}: '
+                f'расхождений {drifted}'
+            )
+        message = (
+            f'{"Найдено" if options["dry_run"] else "Исправлено"} '
+            f'расхождений: {total}.'
+        )
+        if total and options['dry_run']:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,240 @@
+import random
+from bisect import bisect_left
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+
+from recipes.counters import COUNTERS, fix_drift  # isort:skip
+from recipes.models import (FavoritesList, Ingredient, Recipe,  # isort:skip
+                            RecipeIngredient, ShoppingList,
+                            ShoppingListIngredient, Tag)
+from users.models import Follow, User  # isort:skip
+
+
+class SkewedChoice:
+    """Выбор id из диапазона с распределением Ципфа:
+    первые id выпадают намного чаще последних.
+    """
+
+    def __init__(self, first_id, count, skew, rnd):
+        self.first_id = first_id
+        self.rnd = rnd
+        self.cum_weights = list(accumulate(
+            1 / (rank ** skew) for rank in range(1, count + 1)
+        ))
+        self.total = self.cum_weights[-1]
+
+    def __call__(self):
+        point = self.rnd.random() * self.total
+        return self.first_id + bisect_left(self.cum_weights, point)
+
+    def sample(self, size, exclude=None):
+        size = min(size, len(self.cum_weights) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < size:
+            value = self()
+            if value != exclude:
+                chosen.add(value)
+        return chosen
+
+
+class Command(BaseCommand):
+    """
+    Генерируем синтетические данные для нагрузочного тестирования:
+    пользователей, теги, рецепты с ингредиентами, подписки,
+    избранное и списки покупок.
+    python manage.py seed_foodgram --users 100000 --recipes 1000000
+    Данные воспроизводимы при одинаковом --seed и одинаковом
+    исходном состоянии БД. Популярность авторов и рецептов
+    распределена по Ципфу (--skew), часть пользователей получает
+    большие списки покупок (--heavy-cart-share, --heavy-cart-size).
+    Ингредиенты берутся из БД (см. load_ingredients),
+    при их нехватке создаются синтетические.
+    """
+    help = 'Generate synthetic data for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Минимальное число ингредиентов в БД.')
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=15)
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument('--favorites-per-user', type=int, default=30)
+        parser.add_argument('--cart-per-user', type=int, default=3)
+        parser.add_argument('--heavy-cart-share', type=float, default=0.01,
+                            help='Доля пользователей с большой корзиной.')
+        parser.add_argument('--heavy-cart-size', type=int, default=150)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--password', default='foodgram-seed',
+                            help='Пароль всех созданных пользователей.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно минимум 2 пользователя и 1 рецепт')
+        if options['min_ingredients'] > options['max_ingredients']:
+            raise CommandError(
+                '--min-ingredients не может быть больше --max-ingredients'
+            )
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        first_user = self.next_id(User)
+        users = options['users']
+        self.seed_users(first_user, users, options['password'])
+        tag_ids = self.seed_tags(options['tags'])
+        ingredient_ids = self.seed_ingredients(options['ingredients'])
+
+        first_recipe = self.next_id(Recipe)
+        recipes = options['recipes']
+        authors = SkewedChoice(first_user, users, options['skew'], self.rnd)
+        self.seed_recipes(first_recipe, recipes, authors)
+        self.reset_sequences()
+        self.seed_recipe_relations(
+            first_recipe, recipes, tag_ids, ingredient_ids, options
+        )
+
+        popular_recipes = SkewedChoice(
+            first_recipe, recipes, options['skew'], self.rnd
+        )
+        user_ids = range(first_user, first_user + users)
+        self.bulk(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in authors.sample(
+                options['follows_per_user'], exclude=user_id
+            )
+        ))
+        self.bulk(FavoritesList, (
+            FavoritesList(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in popular_recipes.sample(
+                options['favorites_per_user']
+            )
+        ))
+        self.bulk(ShoppingList, (
+            ShoppingList(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in popular_recipes.sample(
+                options['heavy_cart_size']
+                if self.rnd.random() < options['heavy_cart_share']
+                else options['cart_per_user']
+            )
+        ))
+        ShoppingListIngredient.objects.rebuild(user_ids)
+        for model in COUNTERS:
+            fix_drift(model)
+        self.stdout.write(self.style.SUCCESS('Данные сгенерированы.'))
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def bulk(self, model, objects):
+        """Сохраняет объекты пачками, не держа их все в памяти."""
+
+        objects = iter(objects)
+        total = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+
+    def reset_sequences(self):
+        """Id пользователей и рецептов заданы явно,
+        поэтому последовательности нужно сдвинуть.
+        """
+
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Recipe]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def seed_users(self, first_id, count, password):
+        password = make_password(password)
+        self.bulk(User, (
+            User(
+                id=user_id,
+                username=f'seed-user-{user_id}',
+                email=f'seed-user-{user_id}@foodgram.test',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+            )
+            for user_id in range(first_id, first_id + count)
+        ))
+
+    def seed_tags(self, count):
+        self.bulk(Tag, (
+            Tag(
+                name=f'Тег {number}',
+                slug=f'seed-tag-{number}',
+                color='#{:06x}'.format(self.rnd.randrange(0x1000000)),
+            )
+            for number in range(count)
+        ))
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def seed_ingredients(self, minimum):
+        existing = Ingredient.objects.count()
+        self.bulk(Ingredient, (
+            Ingredient(
+                name=f'seed-ingredient-{number}',
+                measurement_unit=self.rnd.choice(('г', 'мл', 'шт.')),
+            )
+            for number in range(existing, minimum)
+        ))
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def seed_recipes(self, first_id, count, authors):
+        self.bulk(Recipe, (
+            Recipe(
+                id=recipe_id,
+                author_id=authors(),
+                name=f'Рецепт {recipe_id}',
+                text='Сгенерированный рецепт для нагрузочного теста.',
+                image='recipes/seed.png',
+                cooking_time=self.rnd.randint(1, 240),
+            )
+            for recipe_id in range(first_id, first_id + count)
+        ))
+
+    def seed_recipe_relations(self, first_id, count, tag_ids,
+                              ingredient_ids, options):
+        recipe_ids = range(first_id, first_id + count)
+        RecipeTag = Recipe.tags.through
+        self.bulk(RecipeTag, (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rnd.sample(
+                tag_ids, min(len(tag_ids), self.rnd.randint(1, 3))
+            )
+        ))
+        self.bulk(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=self.rnd.randint(1, 1000),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.rnd.sample(
+                ingredient_ids,
+                min(len(ingredient_ids), self.rnd.randint(
+                    options['min_ingredients'], options['max_ingredients']
+                )),
+            )
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.19 on 2026-10-18 03:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0, verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Владелец списка покупок')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списках покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_ingredient'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.19 on 2026-10-18 03:38
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Индексы и триггер нужны только в PostgreSQL,
+# в остальных СУБД поиск работает без них.
+POSTGRES_FORWARD = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (name gin_trgm_ops)',
+    'CREATE INDEX recipes_ingredient_upper_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)',
+    'CREATE INDEX recipes_recipe_name_trgm '
+    'ON recipes_recipe USING gin (name gin_trgm_ops)',
+    'CREATE INDEX recipes_recipe_upper_name_trgm '
+    'ON recipes_recipe USING gin (UPPER(name) gin_trgm_ops)',
+    '''
+    CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'CREATE TRIGGER recipes_recipe_search_vector_trigger '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()',
+    'UPDATE recipes_recipe SET name = name',
+    'CREATE INDEX recipes_recipe_search_vector_gin '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+
+POSTGRES_BACKWARD = (
+    'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+    'DROP INDEX IF EXISTS recipes_recipe_upper_name_trgm',
+    'DROP INDEX IF EXISTS recipes_recipe_name_trgm',
+    'DROP INDEX IF EXISTS recipes_ingredient_upper_name_trgm',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+)
+
+
+def run_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Заполняется триггером БД из названия и описания', null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_postgres(POSTGRES_FORWARD),
+            run_postgres(POSTGRES_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.19 on 2026-10-18 03:39
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Перед добавлением уникальности переносим ссылки
+    с дублей ингредиента на самую раннюю запись.
+    """
+
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListIngredient = apps.get_model(
+        'recipes', 'ShoppingListIngredient'
+    )
+    RecipeIngredients = apps.get_model('recipes', 'Recipe').ingredients.through
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for group in groups:
+        duplicates = list(Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit'],
+        ).exclude(id=group['keep_id']).values_list('id', flat=True))
+        RecipeIngredient.objects.filter(
+            ingredient_id__in=duplicates
+        ).update(ingredient_id=group['keep_id'])
+        RecipeIngredients.objects.filter(
+            ingredient_id__in=duplicates
+        ).exclude(
+            recipe_id__in=RecipeIngredients.objects.filter(
+                ingredient_id=group['keep_id']
+            ).values('recipe_id')
+        ).update(ingredient_id=group['keep_id'])
+        for total in ShoppingListIngredient.objects.filter(
+            ingredient_id__in=duplicates
+        ):
+            kept, _ = ShoppingListIngredient.objects.get_or_create(
+                user_id=total.user_id, ingredient_id=group['keep_id']
+            )
+            kept.amount += total.amount
+            kept.save(update_fields=['amount'])
+        Ingredient.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
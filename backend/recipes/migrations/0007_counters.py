@@ -0,0 +1,49 @@
+# Generated by Django 3.2.19 on 2026-10-18 03:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_relations(apps, schema_editor):
+    """Заполняем счетчики по уже существующим связям."""
+
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    counters = (
+        (Recipe, 'favorites_count', 'recipes', 'FavoritesList', 'recipe'),
+        (Recipe, 'shopping_cart_count', 'recipes', 'ShoppingList', 'recipe'),
+        (User, 'recipes_count', 'recipes', 'Recipe', 'author'),
+        (User, 'followers_count', 'users', 'Follow', 'author'),
+    )
+    for target, counter, app_label, model_name, field in counters:
+        model = apps.get_model(app_label, model_name)
+        target.objects.update(**{counter: Coalesce(Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by(
+            ).values(field).annotate(total=Count('pk')).values('total')
+        ), 0)})
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_pub_date_id_idx'),
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(count_relations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Пути к уменьшенным копиям, заполняется в фоне', verbose_name='Копии изображения'),
+        ),
+    ]
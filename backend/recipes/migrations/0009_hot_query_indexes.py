@@ -0,0 +1,52 @@
+# Generated by Django 3.2.19 on 2026-10-18 04:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['recipe', 'ingredient'], include=('amount',), name='recipe_ingredient_idx'),
+        ),
+        # Фильтр по тегам: рецепты тега без обращения к таблице
+        # связей (индекс из уникального ограничения начинается
+        # с recipe_id).
+        migrations.RunSQL(
+            'CREATE INDEX recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX IF EXISTS recipe_tags_tag_recipe_idx',
+        ),
+        migrations.AlterField(
+            model_name='favoriteslist',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_favorites', to=settings.AUTH_USER_MODEL, verbose_name='Владелец списка избранных рецептов'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='shoppinglist',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Владелец списка покупок'),
+        ),
+    ]
@@ -1,6 +1,14 @@
+from itertools import chain
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, validate_slug
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+from users.models import CounterFieldsMixin, Follow
 
 User = get_user_model()
 
@@ -23,6 +31,12 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -60,7 +74,69 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов для API."""
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного и корзины для пользователя."""
+
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(FavoritesList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def with_related(self, user):
+        """Подгружает теги, ингредиенты и автора фиксированным
+        числом запросов.
+        """
+        authors = User.objects.all()
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return self.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+            Prefetch('author', queryset=authors),
+        )
+
+    def first_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора.
+
+        Номер рецепта внутри автора считается оконной функцией
+        ROW_NUMBER() OVER (PARTITION BY author_id), поэтому выборка
+        для всех авторов делается одним запросом.
+        """
+        ranked = self.annotate(author_position=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('pk').desc()],
+        )).order_by().values('pk', 'author_position')
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.filter(pk__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.author_position <= %s',
+            (*params, limit),
+        ))
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецептов."""
 
     author = models.ForeignKey(
@@ -69,6 +145,8 @@ class Recipe(models.Model):
         blank=False,
         related_name='recipes',
         verbose_name='Автор рецепта',
+        # Покрывается индексом recipe_author_pub_date_idx.
+        db_index=False,
     )
     name = models.CharField(
         'Название рецепта',
@@ -116,11 +194,55 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    image_variants = models.JSONField(
+        'Копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Пути к уменьшенным копиям, заполняется в фоне',
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+        help_text='Заполняется триггером БД из названия и описания',
+    )
+
+    counter_fields = ('favorites_count', 'shopping_cart_count')
+    # Копии пишет generate_variants; обычное сохранение не затирает их
+    # устаревшим значением, пока изображение не заменено.
+    derived_fields = {'image_variants': 'image'}
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date', )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -134,6 +256,7 @@ class RecipeIngredient(models.Model):
         on_delete=models.CASCADE,
         related_name='recipe_ingredients',
         verbose_name='Рецепт',
+        db_index=False,
     )
     ingredient = models.ForeignKey(
         Ingredient,
@@ -149,6 +272,14 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте',
         verbose_name_plural = 'Ингредиенты в рецепте'
+        indexes = [
+            # Ингредиенты рецепта читаются без обращения к таблице.
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                include=['amount'],
+                name='recipe_ingredient_idx'
+            ),
+        ]
 
 
 class FavoritesList(models.Model):
@@ -159,6 +290,8 @@ class FavoritesList(models.Model):
         on_delete=models.CASCADE,
         related_name='user_favorites',
         verbose_name='Владелец списка избранных рецептов',
+        # Покрывается уникальным индексом (user, recipe).
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
@@ -190,6 +323,8 @@ class ShoppingList(models.Model):
         on_delete=models.CASCADE,
         related_name='shopping_list',
         verbose_name='Владелец списка покупок',
+        # Покрывается уникальным индексом (user, recipe).
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
@@ -211,3 +346,163 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'Рецепт из корзины покупок {self.user}'
+
+
+class ShoppingListIngredientManager(models.Manager):
+    """Поддержка сводного списка покупок в актуальном состоянии."""
+
+    def upsert(self, select, params):
+        """Прибавляет к сводному списку строки (user_id, ingredient_id,
+        amount), которые возвращает запрос select.
+        """
+
+        totals = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {totals} (user_id, ingredient_id, amount) '
+                f'{select} '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = {totals}.amount + EXCLUDED.amount',
+                params,
+            )
+
+    def apply_recipe(self, recipe_id, sign=1, user_id=None):
+        """Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты
+        рецепта у всех пользователей, у которых он в корзине,
+        либо только у пользователя user_id.
+
+        Для user_id корзина не читается: вычитание выполняется
+        уже после удаления рецепта из корзины.
+        """
+
+        items = RecipeIngredient._meta.db_table
+        if user_id is None:
+            self.upsert(
+                f'SELECT cart.user_id, item.ingredient_id, '
+                f'SUM(item.amount) * %s '
+                f'FROM {ShoppingList._meta.db_table} cart '
+                f'JOIN {items} item ON item.recipe_id = cart.recipe_id '
+                f'WHERE cart.recipe_id = %s '
+                f'GROUP BY cart.user_id, item.ingredient_id',
+                [sign, recipe_id],
+            )
+        else:
+            self.upsert(
+                f'SELECT %s, item.ingredient_id, SUM(item.amount) * %s '
+                f'FROM {items} item WHERE item.recipe_id = %s '
+                f'GROUP BY item.ingredient_id',
+                [user_id, sign, recipe_id],
+            )
+        if sign < 0:
+            emptied = self.filter(
+                amount__lte=0,
+                ingredient_id__in=RecipeIngredient.objects.filter(
+                    recipe_id=recipe_id
+                ).values('ingredient_id'),
+            )
+            if user_id is not None:
+                emptied = emptied.filter(user_id=user_id)
+            emptied.delete()
+
+    def apply_amounts(self, recipe_id, amounts):
+        """Прибавляет количества {id ингредиента: количество} (могут
+        быть отрицательными) всем пользователям, у которых рецепт
+        в корзине, одним запросом.
+        """
+
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not amounts:
+            return
+        delta = ' UNION ALL '.join(
+            ['SELECT %s AS ingredient_id, %s AS amount'] * len(amounts)
+        )
+        self.upsert(
+            f'SELECT cart.user_id, delta.ingredient_id, delta.amount '
+            f'FROM {ShoppingList._meta.db_table} cart '
+            f'CROSS JOIN ({delta}) delta '
+            f'WHERE cart.recipe_id = %s',
+            [*chain.from_iterable(amounts.items()), recipe_id],
+        )
+        decreased = [
+            ingredient_id for ingredient_id, amount in amounts.items()
+            if amount < 0
+        ]
+        if decreased:
+            self.filter(
+                ingredient_id__in=decreased, amount__lte=0
+            ).delete()
+
+    def apply_item(self, recipe_id, ingredient_id, amount):
+        """Прибавляет amount (может быть отрицательным) ингредиента
+        ingredient_id всем пользователям, у которых рецепт в корзине.
+        """
+
+        self.apply_amounts(recipe_id, {ingredient_id: amount})
+
+    def rebuild(self, user_ids=None):
+        """Пересчитывает сводный список покупок с нуля."""
+
+        totals = self.model._meta.db_table
+        stale = self.all()
+        user_filter = ''
+        params = []
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            stale = stale.filter(user_id__in=user_ids)
+            user_filter = 'WHERE cart.user_id IN ({})'.format(
+                ', '.join(['%s'] * len(user_ids)) or 'NULL'
+            )
+            params = user_ids
+        with transaction.atomic():
+            stale.delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {totals} (user_id, ingredient_id, amount) '
+                    f'SELECT cart.user_id, item.ingredient_id, '
+                    f'SUM(item.amount) '
+                    f'FROM {ShoppingList._meta.db_table} cart '
+                    f'JOIN {RecipeIngredient._meta.db_table} item '
+                    f'ON item.recipe_id = cart.recipe_id '
+                    f'{user_filter} '
+                    f'GROUP BY cart.user_id, item.ingredient_id',
+                    params,
+                )
+
+
+class ShoppingListIngredient(models.Model):
+    """Сумма ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_ingredients',
+        verbose_name='Владелец списка покупок',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_totals',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        'Количество',
+        default=0,
+    )
+
+    objects = ShoppingListIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_ingredient'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} в списке покупок {self.user}'
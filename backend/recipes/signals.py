@@ -0,0 +1,132 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from users.models import Follow
+
+from .counters import change_counter
+from .images import (delete_variant_files, needs_variants, schedule_variants,
+                     variant_files)
+from .models import (FavoritesList, Recipe, RecipeIngredient, ShoppingList,
+                     ShoppingListIngredient)
+
+# Отправляется после массовой загрузки ингредиентов в обход save().
+ingredients_loaded = Signal()
+
+
+@receiver(post_save, sender=ShoppingList)
+def add_to_shopping_list_totals(sender, instance, created, **kwargs):
+    """Добавляет ингредиенты рецепта в сводный список покупок."""
+
+    if created and instance.recipe_id:
+        ShoppingListIngredient.objects.apply_recipe(
+            instance.recipe_id, 1, user_id=instance.user_id
+        )
+
+
+@receiver(post_delete, sender=ShoppingList)
+def remove_from_shopping_list_totals(sender, instance, **kwargs):
+    """Вычитает ингредиенты рецепта из сводного списка покупок.
+
+    Вместе с post_delete для RecipeIngredient ингредиенты удаляемого
+    рецепта вычитаются ровно один раз: что удалено раньше - корзина
+    или состав, - то уже не участвует во втором вычитании.
+    """
+
+    if instance.recipe_id:
+        ShoppingListIngredient.objects.apply_recipe(
+            instance.recipe_id, -1, user_id=instance.user_id
+        )
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, raw=False, **kwargs):
+    """Запоминает сохраненную строку состава перед изменением."""
+
+    instance._saved_item = None
+    if not raw and instance.pk is not None:
+        instance._saved_item = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def update_shopping_list_item(sender, instance, raw=False, **kwargs):
+    """Переносит изменение строки состава (админка, прямой save())
+    в списки покупок, где есть рецепт.
+    """
+
+    saved = instance.__dict__.pop('_saved_item', None)
+    if raw:
+        return
+    amount = instance.amount
+    if saved is not None:
+        recipe_id, ingredient_id, saved_amount = saved
+        if (recipe_id, ingredient_id) == (
+            instance.recipe_id, instance.ingredient_id
+        ):
+            amount -= saved_amount
+        else:
+            ShoppingListIngredient.objects.apply_item(
+                recipe_id, ingredient_id, -saved_amount
+            )
+    ShoppingListIngredient.objects.apply_item(
+        instance.recipe_id, instance.ingredient_id, amount
+    )
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_shopping_list_item(sender, instance, **kwargs):
+    ShoppingListIngredient.objects.apply_item(
+        instance.recipe_id, instance.ingredient_id, -instance.amount
+    )
+
+
+@receiver(post_save, sender=FavoritesList)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    """Увеличивает счетчик связанной записи при создании связи."""
+
+    if created and not raw:
+        change_counter(instance, 1)
+
+
+@receiver(post_delete, sender=FavoritesList)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counter(sender, instance, **kwargs):
+    """Уменьшает счетчик связанной записи, в том числе
+    при каскадном удалении.
+    """
+
+    change_counter(instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(sender, instance, created, raw=False,
+                            **kwargs):
+    """После сохранения нового изображения строит его копии в фоне.
+
+    При сохранении без замены изображения копии не перестраиваются:
+    image_variants загруженной записи может быть устаревшим.
+    """
+
+    if raw or not (created or instance.source_changed('image')):
+        return
+    if needs_variants(instance):
+        recipe_id = instance.pk
+        transaction.on_commit(lambda: schedule_variants(recipe_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_variants(sender, instance, **kwargs):
+    """После коммита удаляет файлы копий изображения рецепта."""
+
+    if 'image_variants' in instance.get_deferred_fields():
+        return
+    paths = variant_files(instance.image_variants)
+    if paths:
+        transaction.on_commit(lambda: delete_variant_files(paths))
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
+
 from .models import Follow, User
 
 
@@ -14,7 +15,8 @@ class UserChangeForm(forms.ModelForm):
 
 class UserAdmin(BaseUserAdmin):
     form = UserChangeForm
-    list_display = ('email', 'username', 'first_name', 'last_name')
+    list_display = ('email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         ('Personal info', {'fields': ('username', 'first_name', 'last_name')}),
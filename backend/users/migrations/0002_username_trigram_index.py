@@ -0,0 +1,39 @@
+# Generated by Django 3.2.19 on 2026-10-18 03:38
+
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX users_user_username_trgm '
+    'ON users_user USING gin (username gin_trgm_ops)',
+    'CREATE INDEX users_user_upper_username_trgm '
+    'ON users_user USING gin (UPPER(username) gin_trgm_ops)',
+)
+
+POSTGRES_BACKWARD = (
+    'DROP INDEX IF EXISTS users_user_upper_username_trgm',
+    'DROP INDEX IF EXISTS users_user_username_trgm',
+)
+
+
+def run_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_postgres(POSTGRES_FORWARD),
+            run_postgres(POSTGRES_BACKWARD),
+        ),
+    ]
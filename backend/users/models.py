@@ -3,7 +3,72 @@ from django.db import models
 from django.db.models import F, Q
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """Счетчики counter_fields меняются только атомарным UPDATE
+    (recipes/counters.py). Обычное сохранение загруженной записи
+    их не перезаписывает, иначе параллельные изменения теряются.
+
+    Так же сохраняются derived_fields ({поле: исходное поле}):
+    поле пишется, только если исходное поле изменилось после
+    загрузки записи.
+    """
+
+    counter_fields = ()
+    derived_fields = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        sources = {
+            cls._meta.get_field(source).attname
+            for source in cls.derived_fields.values()
+        }
+        instance._loaded_sources = {
+            name: value for name, value in zip(field_names, values)
+            if name in sources
+        }
+        return instance
+
+    def source_changed(self, name):
+        """Изменилось ли поле name с момента загрузки записи."""
+
+        field = self._meta.get_field(name)
+        loaded = self.__dict__.get('_loaded_sources', {})
+        if field.attname not in loaded:
+            return True
+        value = field.get_prep_value(getattr(self, field.attname))
+        return value != loaded[field.attname]
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding and self.pk is not None):
+            deferred = self.get_deferred_fields()
+            unchanged = {
+                name for name, source in self.derived_fields.items()
+                if not self.source_changed(source)
+            }
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.name not in unchanged
+                and field.attname not in deferred
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+        if self.derived_fields:
+            self._loaded_sources = {
+                field.attname: field.get_prep_value(
+                    getattr(self, field.attname)
+                )
+                for field in map(
+                    self._meta.get_field, self.derived_fields.values()
+                )
+                if field.attname not in self.get_deferred_fields()
+            }
+
+
+class User(CounterFieldsMixin, AbstractUser):
     username = models.CharField(
         max_length=150,
         unique=True,
@@ -24,6 +89,17 @@ class User(AbstractUser):
         max_length=150,
         blank=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False,
+    )
+    counter_fields = ('recipes_count', 'followers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name', 'password')
 
@@ -41,11 +117,15 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
+        # Покрывается индексом follow_user_author_idx.
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='following',
+        # Покрывается уникальным индексом (author, user).
+        db_index=False,
     )
 
     def __str__(self):
@@ -54,6 +134,12 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписки'
         verbose_name_plural = 'Подписки'
+        indexes = [
+            models.Index(
+                fields=['user', 'author'],
+                name='follow_user_author_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['author', 'user'],